@@ -1,15 +1,16 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import base64
+import hashlib
 import json
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import time
+from psycopg2.extras import RealDictCursor, execute_values
 import ml_pipeline
 import weather_service
 import xai_engine
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Before", "X-Next-Before-Id", "ETag", "Server-Timing"])
 
 # --- KORE.AI API SERVICES ---
 from kore_api import kore as kore_blueprint
@@ -21,30 +22,45 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # --- DATABASE CONNECTION ---
-DB_CONFIG = {
-    "dbname": os.getenv("DB_NAME", "farmers"),
-    "user": os.getenv("DB_USER", "postgres"),
-    "password": os.getenv("DB_PASSWORD", "password"),
-    "host": os.getenv("DB_HOST", "localhost"),
-    "port": os.getenv("DB_PORT", "5432")
-}
+# Connections come from the shared pool in db.py and are returned
+# automatically when the request ends (see db.init_app).
+import db
+import manage_db
+import write_behind
+import recommendation_store
+db.init_app(app)
 
 # Global flag to track DB status
 DB_AVAILABLE = False
 
 def get_db_connection():
     global DB_AVAILABLE
+    conn = db.get_connection()
+    DB_AVAILABLE = conn is not None
+    return conn
+
+def active_crop(user_id):
+    """
+    Crop of the user's ACTIVE cultivation, or None.
+    Uses its own short-lived connection, so handlers that go on to call
+    Gemini / STT / TTS don't keep a pooled connection checked out meanwhile.
+    """
+    if not user_id:
+        return None
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        DB_AVAILABLE = True
-        return conn
-            
+        with db.connection() as conn:
+            if not conn:
+                return None
+            cur = conn.cursor()
+            cur.execute("SELECT crop_name FROM Cultivations WHERE user_id = %s AND status = 'ACTIVE' LIMIT 1", (user_id,))
+            res = cur.fetchone()
+            cur.close()
+            return res[0] if res else None
     except Exception as e:
-        print(f"DB Connection Error: {e}")
-        DB_AVAILABLE = False
+        print(f"Chat Context Error: {e}")
         return None
 
-from datetime import timedelta
+from datetime import date, timedelta
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 import bcrypt
 
@@ -92,7 +108,6 @@ def register():
         user_id = cur.fetchone()[0]
         conn.commit()
         cur.close()
-        conn.close()
         
         token = create_access_token(identity=str(user_id))
         return jsonify({"status": "success", "token": token, "user": {"name": name, "phone": phone, "location": location}})
@@ -115,7 +130,6 @@ def login():
         cur.execute("SELECT * FROM Users WHERE phone = %s", (phone,))
         user = cur.fetchone()
         cur.close()
-        conn.close()
         
         if user and user.get('password_hash') and check_password(password, user['password_hash']):
             token = create_access_token(identity=str(user['id']))
@@ -162,14 +176,12 @@ def profile():
             cur.execute("SELECT name, phone, location, profile_pic FROM Users WHERE id = %s", (user_id,))
             user = cur.fetchone()
             cur.close()
-            conn.close()
             return jsonify({"status": "success", "user": user})
             
         else: # GET
             cur.execute("SELECT name, phone, location, profile_pic FROM Users WHERE id = %s", (user_id,))
             user = cur.fetchone()
             cur.close()
-            conn.close()
             if user:
                 return jsonify(user)
             else:
@@ -182,25 +194,19 @@ def profile():
 # Initialize DB Table (Safety check)
 # Initialize DB Table (Safety check)
 def init_db():
-    conn = get_db_connection()
-    if conn:
-        try:
-            # Use absolute path for robustness on Render
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            schema_path = os.path.join(base_dir, 'schema.sql')
-            
-            with open(schema_path, 'r') as f:
-                schema = f.read()
-            cur = conn.cursor()
-            cur.execute(schema)
-            conn.commit()
-            cur.close()
-            conn.close()
-            print("Database initialized successfully.")
-        except Exception as e:
-            print(f"Schema Init Error: {e}")
-    else:
-        print("WARNING: Running without Database. functionality will be limited.")
+    global DB_AVAILABLE
+    with db.connection() as conn:
+        DB_AVAILABLE = conn is not None
+        if conn:
+            try:
+                # Apply any pending versioned migrations (see migrations/)
+                manage_db.migrate(conn)
+                manage_db.ensure_partitions(conn)
+                print("Database initialized successfully.")
+            except Exception as e:
+                print(f"Schema Init Error: {e}")
+        else:
+            print("WARNING: Running without Database. functionality will be limited.")
 
 # Try to init on start (Only once)
 init_db()
@@ -236,10 +242,14 @@ def get_history():
 
     try:
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT recommended_crops, timestamp, soil_type, full_response FROM Recommendations WHERE user_id = %s ORDER BY timestamp DESC LIMIT 20", (user_id,))
+        cur.execute("""
+            SELECT recommended_crops, timestamp, soil_type, weather_json, details, full_response
+            FROM Recommendations WHERE user_id = %s ORDER BY timestamp DESC, id DESC LIMIT 20
+        """, (user_id,))
         rows = cur.fetchall()
         cur.close()
-        conn.close()
+        # Compact rows keep explanations by hash; rebuild the stored response shape
+        recommendation_store.expand(conn, rows)
         
         # Format for frontend
         history = []
@@ -256,6 +266,8 @@ def get_history():
         return jsonify([])
 
 import chatbot_engine
+import schedule_templates
+import ledger_totals
 
 @app.route('/chat', methods=['POST'])
 def chat_bot():
@@ -264,56 +276,129 @@ def chat_bot():
     user_msg = data.get('message', '')
     language = data.get('language', 'en')
     
-    cultivation_context = None
     user_id = None
     try:
         verify_jwt_in_request(optional=True)
         user_id = get_jwt_identity()
-        if user_id:
-            conn = get_db_connection()
-            if conn:
-                cur = conn.cursor()
-                cur.execute("SELECT crop_name FROM Cultivations WHERE user_id = %s AND status = 'ACTIVE' LIMIT 1", (user_id,))
-                res = cur.fetchone()
-                if res:
-                    cultivation_context = res[0]
-                cur.close()
-                conn.close()
     except Exception as e:
         print(f"Chat Context Error: {e}")
+    cultivation_context = active_crop(user_id)
     
     reply = chatbot_engine.get_response(user_msg, language, cultivation_context)
     
     if user_id:
-        try:
-            conn = get_db_connection()
-            if conn:
-                cur = conn.cursor()
-                cur.execute("INSERT INTO Chats (user_id, message, is_bot) VALUES (%s, %s, %s)", (user_id, user_msg, False))
-                cur.execute("INSERT INTO Chats (user_id, message, is_bot) VALUES (%s, %s, %s)", (user_id, reply, True))
-                conn.commit()
-                cur.close()
-                conn.close()
-        except Exception as e:
-            print(f"Chat Save Error: {e}")
+        # Written behind the response by the background flusher
+        write_behind.enqueue("Chats", [(user_id, user_msg, False), (user_id, reply, True)])
         
     return jsonify({"reply": reply})
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    /chat as Server-Sent Events: 'token' events ({"text"}) as Gemini generates,
+    then 'done' ({"reply", "ttfb_ms", "total_ms"}) or 'error'. ttfb_ms is the
+    time from the request to the first token. The full reply is saved to
+    Chats once the stream completes; failed or empty streams are not saved.
+    """
+    started = time.perf_counter()
+    data = request.json
+    user_msg = data.get('message', '')
+    language = data.get('language', 'en')
+    
+    user_id = None
+    try:
+        verify_jwt_in_request(optional=True)
+        user_id = get_jwt_identity()
+    except Exception as e:
+        print(f"Chat Context Error: {e}")
+    # Looked up before streaming starts; nothing holds a DB connection while the stream is open
+    cultivation_context = active_crop(user_id)
+
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    def events():
+        parts = []
+        ttfb_ms = None
+        try:
+            for text in chatbot_engine.stream_response(user_msg, language, cultivation_context):
+                if ttfb_ms is None:
+                    ttfb_ms = (time.perf_counter() - started) * 1000
+                parts.append(text)
+                yield sse("token", {"text": text})
+        except Exception as e:
+            print(f"Gemini Stream Error: {e}")
+            yield sse("error", {"error": "The reply was interrupted. Please try again."})
+            return
+
+        reply = "".join(parts).strip()
+        total_ms = (time.perf_counter() - started) * 1000
+        print(f"Chat stream: ttfb_ms={ttfb_ms or total_ms:.1f}, total_ms={total_ms:.1f}, chars={len(reply)}")
+        if not reply:
+            yield sse("error", {"error": "No reply was generated. Please try again."})
+            return
+        if user_id:
+            # Written behind the response by the background flusher
+            write_behind.enqueue("Chats", [(user_id, user_msg, False), (user_id, reply, True)])
+        yield sse("done", {"reply": reply, "ttfb_ms": round(ttfb_ms or total_ms, 1), "total_ms": round(total_ms, 1)})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Chat history pages (newest page first, messages oldest-first within a page)
+CHAT_PAGE_SIZE = 50
+CHAT_PAGE_MAX = 200
+
 @app.route('/chat_history', methods=['GET'])
 @jwt_required()
 def get_chat_history():
+    """
+    Keyset pagination: ?limit=N&before_id=<cursor>. Items are {text, isBot};
+    the cursor for the next older page is returned in the X-Next-Before-Id header.
+    Chats are append-only, so a page is identified by the newest id in its
+    range; a matching If-None-Match is answered with 304 before any rows are read.
+    """
     user_id = get_jwt_identity()
+    limit = min(max(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 1), CHAT_PAGE_MAX)
+    before_id = request.args.get('before_id', type=int)
+
     conn = get_db_connection()
     if not conn: return jsonify([])
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT message, is_bot FROM Chats WHERE user_id = %s ORDER BY id ASC", (user_id,))
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT MAX(id) FROM Chats WHERE user_id = %s AND id < COALESCE(%s, 2147483647)",
+            (user_id, before_id)
+        )
+        newest_id = cur.fetchone()[0]
+        etag = hashlib.sha1(f"chat:v2:{user_id}:{before_id}:{limit}:{newest_id}".encode()).hexdigest()[:20]
+        # Clients and proxies may send the tag back weak (W/"...")
+        if request.if_none_match.contains_weak(etag):
+            cur.close()
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        cur.execute("""
+            SELECT id, message, is_bot FROM Chats
+            WHERE user_id = %s AND id < COALESCE(%s, 2147483647)
+            ORDER BY id DESC
+            LIMIT %s
+        """, (user_id, before_id, limit + 1))
         rows = cur.fetchall()
         cur.close()
-        conn.close()
-        
-        history = [{"text": r['message'], "isBot": r['is_bot']} for r in rows]
-        return jsonify(history)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        history = [{"text": r[1], "isBot": r[2]} for r in rows]
+
+        response = jsonify(history)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        if has_more:
+            response.headers['X-Next-Before-Id'] = str(rows[0][0])
+        return response
     except Exception as e:
         print(f"Chat History Error: {e}")
         return jsonify([])
@@ -324,11 +409,45 @@ def predict_soil():
     return jsonify({"error": "Use /recommend_hybrid"}), 400
 
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# --- SOIL IMAGE UPLOADS ---
+# Allowance for multipart boundaries and the small text fields next to the image
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+def is_binary_image_upload():
+    mimetype = request.mimetype or ''
+    return (mimetype == 'multipart/form-data' or mimetype.startswith('image/')
+            or mimetype == 'application/octet-stream')
+
+def read_upload_capped(stream, limit, chunk_size=64 * 1024):
+    """Read a raw request body, giving up (None) as soon as it exceeds `limit` bytes."""
+    buf = bytearray()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buf += chunk
+        if len(buf) > limit:
+            return None
+    return bytes(buf)
+
+def image_too_large():
+    return jsonify({"error": "The image is too large. Please upload a smaller photo.", "status": "error"}), 413
+
+def upload_size(file_storage):
+    stream = file_storage.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
 
 @app.route('/recommend_hybrid', methods=['POST'])
 def recommend_hybrid():
     """
     Hybrid endpoint with DB Persistence (User Aware)
+    Image input: JSON 'image_base64', multipart file 'image', or a raw
+    image/* body with lat, lon, etc. as query params.
     """
     try:
         # Try to get user identity if token exists (Optional Auth)
@@ -339,14 +458,42 @@ def recommend_hybrid():
             print(f"DEBUG: JWT Validation Failed: {jwt_err}")
             user_id = None
 
-        data = request.json
+        # The image may arrive as JSON base64 (original contract), as a
+        # multipart 'image' file, or as a raw image body with the other
+        # fields in the query string. Size is capped before anything is decoded.
+        image_source = None
+        if is_binary_image_upload():
+            # Werkzeug stops reading with a 413 once the body passes this, also
+            # for chunked uploads without a Content-Length
+            request.max_content_length = ml_pipeline.SOIL_MAX_IMAGE_BYTES + UPLOAD_FORM_OVERHEAD
+            if request.content_length and request.content_length > ml_pipeline.SOIL_MAX_IMAGE_BYTES + UPLOAD_FORM_OVERHEAD:
+                return image_too_large()
+            if request.mimetype == 'multipart/form-data':
+                data = request.form.to_dict()
+                image_file = request.files.get('image')
+                if image_file and image_file.filename is not None:
+                    if upload_size(image_file) > ml_pipeline.SOIL_MAX_IMAGE_BYTES:
+                        return image_too_large()
+                    image_source = image_file.stream
+            else:
+                data = request.args.to_dict()
+                image_source = read_upload_capped(request.stream, ml_pipeline.SOIL_MAX_IMAGE_BYTES)
+                if image_source is None:
+                    return image_too_large()
+            image_base64 = None
+        else:
+            data = request.json
+            image_base64 = data.get('image_base64')
+            # Reject oversized photos before decoding (base64 is ~4/3 of the raw size)
+            if image_base64 and len(image_base64) * 3 // 4 > ml_pipeline.SOIL_MAX_IMAGE_BYTES:
+                return image_too_large()
+
         # Cast to float to handle string values sent by Kore.ai chatbot
         try:
             lat = float(data.get('lat', 20.59))
             lon = float(data.get('lon', 78.96))
         except (TypeError, ValueError):
             lat, lon = 20.59, 78.96  # fallback: center of India
-        image_base64 = data.get('image_base64')
 
         # 1. Weather
         weather = weather_service.get_current_weather(lat, lon)
@@ -356,17 +503,23 @@ def recommend_hybrid():
         # 2. Soil Analysis
         soil_type = "Unknown"
         soil_conf = 0.0
+        soil_timings = {}
         
-        if image_base64:
+        if image_source is not None or image_base64:
             try:
                 print("DEBUG: Attempting soil analysis...")
-                image_bytes = base64.b64decode(image_base64)
-                soil_type, soil_conf = ml_pipeline.predict_soil_from_image(image_bytes)
-                print(f"DEBUG: Soil type: {soil_type} (conf: {soil_conf})")
+                if image_source is None:
+                    image_source = base64.b64decode(image_base64)
+                soil_type, soil_conf = ml_pipeline.predict_soil_from_image(image_source, soil_timings)
+                print(f"DEBUG: Soil type: {soil_type} (conf: {soil_conf}) timings: " +
+                      ", ".join(f"{k}={v:.1f}" for k, v in soil_timings.items()))
                 
                 if soil_conf < 0.5:
                     return jsonify({"error": "The image doesn't clearly look like recognizable soil. Please upload a clearer photo of the ground.", "status": "error"}), 400
                     
+            except ml_pipeline.ImageTooLarge as e:
+                print(f"WARN: Soil image rejected: {e}")
+                return image_too_large()
             except Exception as e:
                 print(f"WARN: Soil prediction failed: {e}")
                 soil_type = data.get('soil_type', 'Loamy')
@@ -393,10 +546,8 @@ def recommend_hybrid():
         # 5. XAI & Formatting
         recommendations = []
         language = data.get('language', 'en')
-        for item in top_crops:
-            exp = xai_engine.generate_explanation(
-                item['crop'], soil_type, weather, item['confidence'], language=language
-            )
+        explanations = xai_engine.generate_explanations(top_crops, soil_type, weather, language=language)
+        for item, exp in zip(top_crops, explanations):
             recommendations.append({
                 "crop": item['crop'],
                 "confidence": item['confidence'],
@@ -404,82 +555,75 @@ def recommend_hybrid():
                 "explanation": exp
             })
             
-        RISK_TEMPLATES = {
-            "en": {
-                "high_humidity": "Possible pests due to high humidity",
-                "normal": "Normal risks",
-                "drainage": "Ensure proper drainage",
-                "organic": "Use organic fertilizers"
-            },
-            "hi": {
-                "high_humidity": "उच्च आर्द्रता के कारण कीटों का खतरा",
-                "normal": "सामान्य जोखिम",
-                "drainage": "उचित जल निकासी सुनिश्चित करें",
-                "organic": "जैविक उर्वरकों का प्रयोग करें"
-            },
-             "te": {
-                "high_humidity": "ఎక్కువ తేమ కారణంగా చీడపీడల రావచ్చు",
-                "normal": "సాధారణ ప్రమాదాలు",
-                "drainage": "సరైన నీటి పారుదల ఉండేలా చూసుకోండి",
-                "organic": "సేంద్రీయ ఎరువులు వాడండి"
-            },
-            "ta": {
-                "high_humidity": "அதிக ஈரப்பதம் காரணமாக பூச்சிகள் வரலாம்",
-                "normal": "சாதாரண இடர்கள்",
-                "drainage": "சரியான வடிகால் வசதி செய்யுங்கள்",
-                "organic": "இயற்கை உரங்களைப் பயன்படுத்துங்கள்"
-            }
-        }
-        
-        # Fallback to English if lang not found
-        rt = RISK_TEMPLATES.get(language, RISK_TEMPLATES["en"])
-        
-        risks_precautions = {
-            "risks": [rt["high_humidity"] if weather['humidity'] > 80 else rt["normal"]],
-            "precautions": [rt["drainage"], rt["organic"]]
-        }
+        result = recommendation_store.build_result(soil_type, soil_conf, (n, p, k), weather, recommendations, language)
         
-        result = {
-            "soil_assessment": {
-                "type": soil_type,
-                "confidence": float(soil_conf),
-                "inferred_npk": {"N": n, "P": p, "K": k},
-                "moisture": "High" if weather['rainfall'] > 100 else "Medium",
-                "fertility": "High" if n > 50 else "Medium"
-            },
-            "weather_summary": {
-                "temperature": weather['temperature'],
-                "rainfall": weather['rainfall'],
-                "humidity": weather['humidity'],
-                "season": "Kharif"
-            },
-            "recommended_crops": recommendations,
-            "risks_precautions": risks_precautions,
-            "timestamp": "Just Now"
-        }
-        
-        # --- SAVE TO DB ---
-        conn = get_db_connection()
-        if conn:
-            try:
-                cur = conn.cursor()
-                cur.execute("""
-                    INSERT INTO Recommendations (user_id, latitude, longitude, soil_type, weather_json, recommended_crops, full_response)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (user_id if user_id else None, lat, lon, soil_type, json.dumps(weather), json.dumps(recommendations), json.dumps(result)))
-                conn.commit()
-                cur.close()
-                conn.close()
-            except Exception as e:
-                print(f"DB Save Error: {e}")
+        # --- SAVE TO DB (compact layout, written behind the response) ---
+        recommendation_store.record_hybrid(
+            user_id if user_id else None, lat, lon, soil_type, weather, recommendations, result,
+            soil_conf=soil_conf, npk=(n, p, k), language=language
+        )
         
-        return jsonify(result)
+        response = jsonify(result)
+        if soil_timings:
+            # e.g. "soil_decode;dur=12.3, soil_resize;dur=1.1, soil_inference;dur=40.2"
+            response.headers['Server-Timing'] = ", ".join(
+                f"soil_{k[:-3]};dur={v:.1f}" for k, v in soil_timings.items()
+            )
+        return response
 
+    except RequestEntityTooLarge:
+        return image_too_large()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# --- BULK CROP SCORING ---
+import pandas as pd
+
+# Upper bound on rows scored by one /recommend_batch call
+MAX_BATCH_ROWS = int(os.getenv("MAX_BATCH_ROWS", "50000"))
+
+@app.route('/recommend_batch', methods=['POST'])
+def recommend_batch():
+    """
+    Bulk crop scoring (e.g. a district's soil-card registry) in one model call.
+    JSON: { "rows": [[N, P, K, temperature, humidity, ph, rainfall], ...] or [{"N": .., ...}], "top_k": 3 }
+    CSV:  multipart upload in field 'file' with a header row naming the 7 feature columns.
+    """
+    try:
+        if 'file' in request.files:
+            rows = pd.read_csv(request.files['file'].stream)
+            top_k = request.form.get('top_k', 3, type=int)
+        else:
+            data = request.get_json(silent=True) or {}
+            rows = data.get('rows')
+            top_k = int(data.get('top_k', 3))
+            if not isinstance(rows, list):
+                return jsonify({"status": "error", "message": "Provide 'rows' as a JSON array or upload a CSV file"}), 400
+            if rows and isinstance(rows[0], dict):
+                rows = pd.DataFrame(rows)
+
+        if len(rows) > MAX_BATCH_ROWS:
+            return jsonify({"status": "error", "message": f"Too many rows (max {MAX_BATCH_ROWS})"}), 413
+
+        predictions = ml_pipeline.predict_crop_batch(rows, top_k=top_k)
+        if isinstance(predictions, str):
+            return jsonify({"status": "error", "message": predictions}), 503
+
+        return jsonify({"status": "success", "count": len(predictions), "predictions": predictions})
+
+    except (ValueError, KeyError, pd.errors.ParserError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        print(f"Batch Recommend Error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 # --- CULTIVATION & LEDGER ENDPOINTS ---
+# Page sizes for /api/cultivation/history
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_MAX = 200
+
 @app.route('/api/cultivation/start', methods=['POST'])
 @jwt_required()
 def start_cultivation():
@@ -489,31 +633,40 @@ def start_cultivation():
     
     if not crop_name:
          return jsonify({"error": "Crop name required"}), 400
+
+    # Phase 1: resolve the schedule before touching the DB, so a template
+    # miss that falls through to Gemini never holds a connection or row locks
+    tasks = schedule_templates.get_schedule(crop_name)
+    today = date.today()
+    schedule_rows = [
+        (t.get('task_name'), today + timedelta(days=t.get('days_from_start', 0)))
+        for t in tasks
+    ]
          
     conn = get_db_connection()
     if not conn: return jsonify({"error": "DB Error"}), 500
     
+    # Phase 2: one short transaction
     try:
         cur = conn.cursor()
-        # Mark others as completed
-        cur.execute("UPDATE Cultivations SET status = 'COMPLETED' WHERE user_id = %s AND status = 'ACTIVE'", (user_id,))
-        # Insert new cultivation
-        cur.execute("INSERT INTO Cultivations (user_id, crop_name) VALUES (%s, %s) RETURNING id", (user_id, crop_name))
+        # Mark others as completed and insert the new cultivation in one statement
+        cur.execute("""
+            WITH closed AS (
+                UPDATE Cultivations SET status = 'COMPLETED' WHERE user_id = %s AND status = 'ACTIVE'
+            )
+            INSERT INTO Cultivations (user_id, crop_name) VALUES (%s, %s) RETURNING id
+        """, (user_id, user_id, crop_name))
         cultivation_id = cur.fetchone()[0]
         
-        # Ask Gemini to generate schedule
-        tasks = chatbot_engine.generate_cultivation_schedule(crop_name)
-        
-        from datetime import datetime, timedelta
-        for t in tasks:
-            days = t.get('days_from_start', 0)
-            task_date = datetime.now() + timedelta(days=days)
-            cur.execute("INSERT INTO Schedules (cultivation_id, task_name, due_date) VALUES (%s, %s, %s)",
-                       (cultivation_id, t.get('task_name'), task_date.strftime('%Y-%m-%d')))
+        if schedule_rows:
+            execute_values(
+                cur,
+                "INSERT INTO Schedules (cultivation_id, task_name, due_date) VALUES %s",
+                [(cultivation_id, name, due) for name, due in schedule_rows]
+            )
                        
         conn.commit()
         cur.close()
-        conn.close()
         return jsonify({"status": "success", "message": f"Started {crop_name}", "tasks": len(tasks)})
     except Exception as e:
         print(f"Cultivation Start Error: {e}")
@@ -540,13 +693,14 @@ def get_active_cultivation():
         ledgers = cur.fetchall()
         
         cur.close()
-        conn.close()
         
         # Format dates for JSON
         for s in schedules: s['due_date'] = str(s['due_date'])
         for l in ledgers: 
             l['date'] = str(l['date'])
             l['amount'] = float(l['amount'])
+        active_crop['total_profit'] = float(active_crop['total_profit'])
+        active_crop['total_expense'] = float(active_crop['total_expense'])
             
         return jsonify({
             "status": "active",
@@ -567,7 +721,6 @@ def update_schedule(task_id):
         cur.execute("UPDATE Schedules SET completed = %s WHERE id = %s", (completed, task_id))
         conn.commit()
         cur.close()
-        conn.close()
         return jsonify({"status": "success"})
     return jsonify({"error": "DB Error"}), 500
 
@@ -588,24 +741,16 @@ def add_ledger():
         cultivation_id = active['id']
         crop_name = active['crop_name']
 
-        # Insert the new entry
-        cur.execute(
-            "INSERT INTO Ledgers (cultivation_id, type, amount, category, notes) VALUES (%s, %s, %s, %s, %s)",
-            (cultivation_id, data['type'].upper(), float(data['amount']), data.get('category', 'General'), data.get('notes', ''))
+        # Insert the new entry; the running totals come back from the same statement
+        total_profit, total_expense = ledger_totals.add_entry(
+            cur, cultivation_id, data['type'].upper(), float(data['amount']),
+            data.get('category', 'General'), data.get('notes', '')
         )
         conn.commit()
 
-        # Calculate running totals
-        cur.execute("SELECT COALESCE(SUM(amount), 0) AS total FROM Ledgers WHERE cultivation_id = %s AND type = 'PROFIT'", (cultivation_id,))
-        total_profit = float(cur.fetchone()['total'])
-
-        cur.execute("SELECT COALESCE(SUM(amount), 0) AS total FROM Ledgers WHERE cultivation_id = %s AND type = 'EXPENSE'", (cultivation_id,))
-        total_expense = float(cur.fetchone()['total'])
-
         net = total_profit - total_expense
 
         cur.close()
-        conn.close()
         return jsonify({
             "status": "success",
             "crop_name": crop_name,
@@ -631,7 +776,6 @@ def finish_cultivation():
         cur.execute("UPDATE Cultivations SET status = 'COMPLETED' WHERE user_id = %s AND status = 'ACTIVE'", (user_id,))
         conn.commit()
         cur.close()
-        conn.close()
         return jsonify({"status": "success", "message": "Cultivation marked as completed."})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -639,33 +783,44 @@ def finish_cultivation():
 @app.route('/api/cultivation/history', methods=['GET'])
 @jwt_required()
 def get_cultivation_history():
+    """
+    Completed cultivations with profit/expense totals, newest first.
+    Keyset pagination: ?limit=N&before=<cursor>, where the cursor
+    ("<start_date>,<id>" of the last row seen) is returned in the X-Next-Before header.
+    """
     user_id = get_jwt_identity()
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_PAGE_MAX)
+    before = request.args.get('before')
+    try:
+        ledger_totals.parse_history_cursor(before)
+    except ValueError:
+        return jsonify({"error": "Invalid 'before' cursor"}), 400
+
     conn = get_db_connection()
     if not conn: return jsonify({"error": "DB Error"}), 500
     try:
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM Cultivations WHERE user_id = %s AND status = 'COMPLETED' ORDER BY start_date DESC", (user_id,))
-        cultivations = cur.fetchall()
-        
+        # Totals are maintained on the cultivation row, so no ledger scan is needed
+        rows, next_before = ledger_totals.history_page(cur, user_id, limit, before)
+        cur.close()
+
         history_data = []
-        for c in cultivations:
-            cur.execute("SELECT SUM(amount) FROM Ledgers WHERE cultivation_id = %s AND type = 'PROFIT'", (c['id'],))
-            profit = cur.fetchone()['sum'] or 0
-            cur.execute("SELECT SUM(amount) FROM Ledgers WHERE cultivation_id = %s AND type = 'EXPENSE'", (c['id'],))
-            expense = cur.fetchone()['sum'] or 0
-            
+        for c in rows:
+            profit = float(c['profit'])
+            expense = float(c['expense'])
             history_data.append({
                 "id": c['id'],
                 "crop_name": c['crop_name'],
                 "start_date": str(c['start_date']),
-                "profit": float(profit),
-                "expense": float(expense),
-                "net": float(profit) - float(expense)
+                "profit": profit,
+                "expense": expense,
+                "net": profit - expense
             })
             
-        cur.close()
-        conn.close()
-        return jsonify(history_data)
+        response = jsonify(history_data)
+        if next_before:
+            response.headers['X-Next-Before'] = next_before
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -692,10 +847,11 @@ def get_cultivation_history_details(cultivation_id):
         ledgers = cur.fetchall()
         
         cur.close()
-        conn.close()
         
         # Format dates for JSON
         cultivation['start_date'] = str(cultivation['start_date'])
+        cultivation['total_profit'] = float(cultivation['total_profit'])
+        cultivation['total_expense'] = float(cultivation['total_expense'])
         for s in schedules: s['due_date'] = str(s['due_date'])
         for l in ledgers: 
             l['date'] = str(l['date'])
@@ -714,76 +870,116 @@ def get_cultivation_history_details(cultivation_id):
 
 # --- VOICE ASSISTANT ENDPOINT ---
 import voice_service
-import uuid
+import voice_jobs
+
+def read_voice_request():
+    """
+    Common input of the voice endpoints.
+    -> ((audio bytes, language, user_id, cultivation_context), None) or (None, error response)
+    """
+    if 'audio' not in request.files:
+        return None, (jsonify({"error": "No audio file provided"}), 400)
+    audio_file = request.files['audio']
+    language = request.form.get('language', 'en')
+    if upload_size(audio_file) > voice_service.VOICE_MAX_UPLOAD_BYTES:
+        return None, (jsonify({"error": "The recording is too long. Please keep it shorter."}), 413)
+
+    # Optional Context Checking
+    user_id = None
+    try:
+        verify_jwt_in_request(optional=True)
+        user_id = get_jwt_identity()
+    except: pass
+    return (audio_file.read(), language, user_id, active_crop(user_id)), None
 
 @app.route('/api/voice_chat', methods=['POST'])
 def voice_chat():
+    """
+    Voice round trip: the upload is decoded in memory straight to PCM for
+    speech recognition (no input file is written). Per-stage times are
+    returned in the Server-Timing header: decode, stt, llm, tts.
+    For the same turn without holding the request open, see /api/voice_jobs.
+    """
     try:
-        if 'audio' not in request.files:
-            return jsonify({"error": "No audio file provided"}), 400
-            
-        audio_file = request.files['audio']
-        language = request.form.get('language', 'en')
-        
-        # Save temp audio file from mobile
-        temp_id = str(uuid.uuid4())
-        audio_ext = os.path.splitext(audio_file.filename)[1]
-        input_audio_path = os.path.join('static', 'audio', f"in_{temp_id}{audio_ext}")
-        audio_file.save(input_audio_path)
-        
-        # 1. Speech-to-Text
-        user_text = voice_service.transcribe_audio(input_audio_path, language)
-        if not user_text:
-            return jsonify({"error": "Could not understand audio"}), 400
-            
-        # Optional Context Checking
-        cultivation_context = None
-        user_id = None
+        voice_input, error = read_voice_request()
+        if error:
+            return error
+        timings = {}
         try:
-            verify_jwt_in_request(optional=True)
-            user_id = get_jwt_identity()
-            if user_id:
-                conn = get_db_connection()
-                if conn:
-                    cur = conn.cursor()
-                    cur.execute("SELECT crop_name FROM Cultivations WHERE user_id = %s AND status = 'ACTIVE' LIMIT 1", (user_id,))
-                    res = cur.fetchone()
-                    if res: cultivation_context = res[0]
-                    cur.close()
-                    conn.close()
-        except: pass
+            result = voice_jobs.run_pipeline(*voice_input, timings=timings)
+        except voice_jobs.VoiceInputError as e:
+            return jsonify({"error": str(e)}), 400
+        print("Voice chat timings: " + ", ".join(f"{k}={v:.1f}" for k, v in timings.items()))
         
-        # 2. Chatbot AI Engine
-        reply_text = chatbot_engine.get_response(user_text, language, cultivation_context)
-        
-        if user_id:
-            try:
-                conn = get_db_connection()
-                if conn:
-                    cur = conn.cursor()
-                    cur.execute("INSERT INTO Chats (user_id, message, is_bot) VALUES (%s, %s, %s)", (user_id, user_text, False))
-                    cur.execute("INSERT INTO Chats (user_id, message, is_bot) VALUES (%s, %s, %s)", (user_id, reply_text, True))
-                    conn.commit()
-                    cur.close()
-                    conn.close()
-            except Exception as e:
-                print(f"Voice Chat Save Error: {e}")
-        
-        # 3. Text-to-Speech
-        output_audio_path = os.path.join('static', 'audio', f"out_{temp_id}.mp3")
-        voice_service.text_to_speech(reply_text, language, output_audio_path)
-        
-        return jsonify({
-            "status": "success",
-            "user_text": user_text,
-            "reply": reply_text,
-            "audio_url": f"/static/audio/out_{temp_id}.mp3"
-        })
+        response = jsonify({"status": "success", **result})
+        # e.g. "decode;dur=35.2, stt;dur=812.0, llm;dur=1490.3, tts;dur=640.8"
+        response.headers['Server-Timing'] = ", ".join(f"{k[:-3]};dur={v:.1f}" for k, v in timings.items())
+        return response
         
     except Exception as e:
         print(f"Voice Chat Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+# --- VOICE JOBS (async voice chat) ---
+VOICE_JOB_SSE_TIMEOUT = float(os.getenv("VOICE_JOB_SSE_TIMEOUT", "90"))   # longest an events stream stays open
+
+@app.route('/api/voice_jobs', methods=['POST'])
+def create_voice_job():
+    """
+    Same input as /api/voice_chat, but returns 202 with a job id right away.
+    Follow the job with GET /api/voice_jobs/<id> (poll) or .../events (SSE).
+    """
+    voice_input, error = read_voice_request()
+    if error:
+        return error
+    job_id = voice_jobs.submit(*voice_input)
+    if job_id is None:
+        return jsonify({"error": "Voice service is busy. Please try again shortly."}), 503
+    return jsonify({
+        "status": "queued",
+        "job_id": job_id,
+        "status_url": f"/api/voice_jobs/{job_id}",
+        "events_url": f"/api/voice_jobs/{job_id}/events"
+    }), 202
+
+@app.route('/api/voice_jobs/<job_id>', methods=['GET'])
+def get_voice_job(job_id):
+    """
+    status: queued | running | done | error; stage: decode | stt | llm | tts
+    while running. user_text and reply are filled in as soon as they exist.
+    """
+    job = voice_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    return jsonify(job)
+
+@app.route('/api/voice_jobs/<job_id>/events', methods=['GET'])
+def voice_job_events(job_id):
+    """Server-Sent Events: one 'job' event per change, ending with status done or error."""
+    job = voice_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+
+    def events(job):
+        deadline = time.monotonic() + VOICE_JOB_SSE_TIMEOUT
+        version = -1
+        while job is not None:
+            if job["version"] != version:
+                version = job["version"]
+                yield f"event: job\ndata: {json.dumps(job)}\n\n"
+                if job["status"] in ("done", "error"):
+                    return
+            else:
+                yield ": keep-alive\n\n"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield "event: timeout\ndata: {}\n\n"
+                return
+            job = voice_jobs.wait(job_id, version, min(15.0, remaining))
+
+    return Response(stream_with_context(events(job)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     app.run(debug=True, host='0.0.0.0', port=port)
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark: single-request crop prediction, sklearn vs compiled forest.
+Mismatches compare what predict_crop() and predict_crop_batch() return with
+the original implementation (sklearn + argsort); test_crop_predict.py checks
+the same thing.
+Usage: python bench_crop_predict.py [iterations]
+"""
+import sys
+import time
+import numpy as np
+import ml_pipeline
+
+def baseline_top3(probs):
+    # The original predict_crop() selection, frozen here as the reference
+    return [(str(ml_pipeline.crop_model.classes_[i]), float(probs[i])) for i in np.argsort(probs)[-3:][::-1]]
+
+def pairs(crops):
+    return [(str(c["crop"]), c["confidence"]) for c in crops]
+
+def percentiles(samples):
+    arr = np.array(samples) * 1e6
+    return np.percentile(arr, 50), np.percentile(arr, 99)
+
+def bench(iterations=2000):
+    if ml_pipeline.crop_forest is None:
+        print("Compiled forest not available (CROP_FAST_PATH=0 or compile failed).")
+        return
+
+    rng = np.random.default_rng(42)
+    rows = rng.uniform([0, 0, 0, 5, 10, 3, 20], [140, 145, 205, 45, 100, 10, 300], size=(iterations, 7))
+
+    # Warm up both paths
+    for row in rows[:20]:
+        ml_pipeline.sklearn_predict_proba(list(row))
+        ml_pipeline.forest_predict_proba(ml_pipeline.crop_forest, row)
+
+    sk_times, fast_times, mismatches = [], [], 0
+    for row in rows:
+        values = list(row)
+
+        t0 = time.perf_counter()
+        sk_probs = ml_pipeline.sklearn_predict_proba(values)
+        sk_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        ml_pipeline.forest_predict_proba(ml_pipeline.crop_forest, values)
+        fast_times.append(time.perf_counter() - t0)
+
+        if pairs(ml_pipeline.predict_crop(*values)) != baseline_top3(sk_probs):
+            mismatches += 1
+
+    batch = ml_pipeline.predict_crop_batch(rows)
+    batch_mismatches = sum(pairs(crops) != baseline_top3(ml_pipeline.sklearn_predict_proba(list(row)))
+                           for row, crops in zip(rows, batch))
+
+    sk_p50, sk_p99 = percentiles(sk_times)
+    fast_p50, fast_p99 = percentiles(fast_times)
+    print(f"Rows: {iterations}")
+    print(f"sklearn + pandas : p50 {sk_p50:8.1f} us   p99 {sk_p99:8.1f} us")
+    print(f"compiled forest  : p50 {fast_p50:8.1f} us   p99 {fast_p99:8.1f} us")
+    print(f"Speedup (p50)    : {sk_p50 / fast_p50:.1f}x")
+    print(f"Top-3 mismatches : {mismatches} single, {batch_mismatches} batch (vs original predict_crop)")
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -31,6 +31,13 @@ Your goal is to help farmers with crops, fertilizers, diseases, weather, and gov
 - If asked about prices or subsidies, give general info and suggest checking official sources like e-NAM.
 """
 
+def build_prompt(message, language='en', cultivation_context=None):
+    dynamic_system_prompt = SYSTEM_PROMPT
+    if cultivation_context:
+        dynamic_system_prompt += f"\n\nIMPORTANT CONTEXT: The user is currently cultivating {cultivation_context}. Keep this in mind for all your advice."
+    
+    return f"{dynamic_system_prompt}\n\nUser ({language}): {message}\nSmart Kisan:"
+
 def get_response(message, language='en', cultivation_context=None):
     """
     Generates a response using Gemini API.
@@ -45,11 +52,7 @@ def get_response(message, language='en', cultivation_context=None):
 
     try:
         # Construct Prompt
-        dynamic_system_prompt = SYSTEM_PROMPT
-        if cultivation_context:
-            dynamic_system_prompt += f"\n\nIMPORTANT CONTEXT: The user is currently cultivating {cultivation_context}. Keep this in mind for all your advice."
-        
-        full_prompt = f"{dynamic_system_prompt}\n\nUser ({language}): {message}\nSmart Kisan:"
+        full_prompt = build_prompt(message, language, cultivation_context)
         
         response = client.models.generate_content(
             model='gemini-2.5-flash',
@@ -65,6 +68,23 @@ def get_response(message, language='en', cultivation_context=None):
         sys.stdout.flush()
         return f"DEBUG: Gemini Error: {str(e)}"
 
+def stream_response(message, language='en', cultivation_context=None):
+    """
+    Same prompt as get_response, but yields the reply text in chunks as
+    Gemini generates it. Errors are raised to the caller (which may already
+    have sent part of the reply).
+    """
+    if not client:
+        yield f"DEBUG: Offline. Key Present: {bool(API_KEY)}. Path: {os.getcwd()}"
+        return
+
+    for chunk in client.models.generate_content_stream(
+        model='gemini-2.5-flash',
+        contents=build_prompt(message, language, cultivation_context)
+    ):
+        if chunk.text:
+            yield chunk.text
+
 def generate_cultivation_schedule(crop_name):
     """
     Generates a generic farming schedule for a given crop in JSON format.
@@ -0,0 +1,185 @@
+"""
+db.py — Shared PostgreSQL connection pool for Smart Kisan
+Used by app.py (main API) and kore_api.py (Kore.ai blueprint).
+
+Inside a request, get_connection() hands out one pooled connection that is
+reused for the whole request and returned to the pool on teardown, so early
+returns can no longer leak connections. Outside a request (startup, scripts,
+background threads) use the `connection()` context manager instead.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+from psycopg2 import pool
+from flask import g, has_app_context
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_CONFIG = {
+    "dbname": os.getenv("DB_NAME", "farmers"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", "password"),
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": os.getenv("DB_PORT", "5432")
+}
+
+# Pool sizing (gunicorn runs 8 threads per worker, so keep max >= threads)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Seconds a request waits for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+
+def get_pool():
+    """Create the pool on first use (and again after a fork, e.g. gunicorn --preload)."""
+    global _pool, _pool_pid, _slots
+
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            return _pool
+        # Connections inherited from the parent process share its sockets,
+        # so they are dropped (not closed) and a fresh pool is built.
+        try:
+            _pool = pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_CONFIG)
+            _pool_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(DB_POOL_MAX)
+            print(f"DB Pool created (min={DB_POOL_MIN}, max={DB_POOL_MAX})")
+        except Exception as e:
+            print(f"DB Connection Error: {e}")
+            _pool = None
+        return _pool
+
+
+def _is_alive(conn):
+    """Cheap liveness check so a connection dropped by the server is never handed out."""
+    if conn.closed:
+        return False
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+
+def acquire():
+    """
+    Check a validated connection out of the pool.
+    Returns None if the database is unreachable or the pool stays exhausted.
+    Every successful acquire() must be paired with release().
+    """
+    p = get_pool()
+    if p is None:
+        return None
+
+    if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+        print("DB Pool Error: timed out waiting for a free connection")
+        return None
+
+    try:
+        # One retry: the first stale connection is discarded, the next is usually fresh
+        for _ in range(2):
+            conn = p.getconn()
+            if _is_alive(conn):
+                return conn
+            p.putconn(conn, close=True)
+        print("DB Pool Error: could not obtain a live connection")
+    except Exception as e:
+        print(f"DB Connection Error: {e}")
+    _slots.release()
+    return None
+
+
+def release(conn):
+    """Return a connection to the pool, rolling back anything left uncommitted."""
+    if conn is None:
+        return
+    p = _pool
+    try:
+        if not conn.closed:
+            conn.rollback()
+        if p is not None and _pool_pid == os.getpid():
+            p.putconn(conn, close=conn.closed)
+        else:
+            conn.close()
+    except Exception as e:
+        print(f"DB Release Error: {e}")
+        try:
+            if p is not None:
+                p.putconn(conn, close=True)
+        except Exception:
+            pass
+    finally:
+        _slots.release()
+
+
+def get_connection():
+    """
+    Return the pooled connection bound to the current request.
+    The same connection is reused for the rest of the request and handed
+    back by close_request_connection() when the app context tears down.
+    """
+    if not has_app_context():
+        raise RuntimeError("get_connection() needs an app context; use db.connection() instead")
+
+    conn = g.get('_db_conn')
+    if conn is not None:
+        if not conn.closed:
+            return conn
+        # Dropped mid-request: give its pool slot back before taking another
+        release(conn)
+        g._db_conn = None
+
+    conn = acquire()
+    g._db_conn = conn
+    return conn
+
+
+def close_request_connection(exc=None):
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        release(conn)
+
+
+@contextmanager
+def connection():
+    """
+    Pooled connection for code running outside a request.
+    Yields None if the database is unavailable.
+    """
+    conn = acquire()
+    try:
+        yield conn
+    finally:
+        release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_request_connection)
+
+
+def pool_status():
+    """Small snapshot for health endpoints."""
+    p = _pool
+    if p is None or _pool_pid != os.getpid():
+        return {"created": False, "min": DB_POOL_MIN, "max": DB_POOL_MAX}
+    return {
+        "created": True,
+        "min": DB_POOL_MIN,
+        "max": DB_POOL_MAX,
+        "in_use": len(p._used),
+        "idle": len(p._pool),
+    }
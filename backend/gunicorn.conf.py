@@ -0,0 +1,7 @@
+# Gunicorn loads this file from the working directory automatically;
+# flags given on the command line (Procfile, Dockerfile) still take precedence.
+
+def worker_exit(server, worker):
+    # Flush queued Chats / Recommendations rows before the worker goes away
+    import write_behind
+    write_behind.drain()
@@ -94,3 +94,31 @@ CROP_INFO = {
         }
     }
 }
+
+# Risk / precaution lines shown with every crop recommendation
+RISK_TEMPLATES = {
+    "en": {
+        "high_humidity": "Possible pests due to high humidity",
+        "normal": "Normal risks",
+        "drainage": "Ensure proper drainage",
+        "organic": "Use organic fertilizers"
+    },
+    "hi": {
+        "high_humidity": "उच्च आर्द्रता के कारण कीटों का खतरा",
+        "normal": "सामान्य जोखिम",
+        "drainage": "उचित जल निकासी सुनिश्चित करें",
+        "organic": "जैविक उर्वरकों का प्रयोग करें"
+    },
+    "te": {
+        "high_humidity": "ఎక్కువ తేమ కారణంగా చీడపీడల రావచ్చు",
+        "normal": "సాధారణ ప్రమాదాలు",
+        "drainage": "సరైన నీటి పారుదల ఉండేలా చూసుకోండి",
+        "organic": "సేంద్రీయ ఎరువులు వాడండి"
+    },
+    "ta": {
+        "high_humidity": "அதிக ஈரப்பதம் காரணமாக பூச்சிகள் வரலாம்",
+        "normal": "சாதாரண இடர்கள்",
+        "drainage": "சரியான வடிகால் வசதி செய்யுங்கள்",
+        "organic": "இயற்கை உரங்களைப் பயன்படுத்துங்கள்"
+    }
+}
@@ -6,33 +6,33 @@ All responses follow a flat, Kore.ai-friendly JSON structure.
 
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import (
-    JWTManager, create_access_token, jwt_required,
+    create_access_token, jwt_required,
     get_jwt_identity, verify_jwt_in_request
 )
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import os, json
+from psycopg2.extras import RealDictCursor, execute_values
+import os
 from datetime import datetime, timedelta
 
+import db
 import chatbot_engine
 import weather_service
 import ml_pipeline
+import xai_cache
+import schedule_templates
+import ledger_totals
+import write_behind
+import voice_store
+import tts_cache
+import voice_jobs
+import recommendation_store
 
 kore = Blueprint('kore', __name__, url_prefix='/kore/v1')
 
 # ─── DB helper ────────────────────────────────────────────────────────────────
+# Shares the pool from db.py with app.py; the connection is returned to the
+# pool when the request ends, so handlers never close it themselves.
 def get_db():
-    try:
-        return psycopg2.connect(
-            dbname=os.getenv("DB_NAME", "farmers"),
-            user=os.getenv("DB_USER", "postgres"),
-            password=os.getenv("DB_PASSWORD", "password"),
-            host=os.getenv("DB_HOST", "localhost"),
-            port=os.getenv("DB_PORT", "5432"),
-        )
-    except Exception as e:
-        print(f"DB Error: {e}")
-        return None
+    return db.get_connection()
 
 def ok(data: dict):
     return jsonify({"status": "success", **data})
@@ -67,7 +67,7 @@ def kore_login():
         cur = conn.cursor(cursor_factory=RealDictCursor)
         cur.execute("SELECT * FROM Users WHERE phone = %s", (phone,))
         user = cur.fetchone()
-        cur.close(); conn.close()
+        cur.close()
 
         import bcrypt
         if not user or not bcrypt.checkpw(password.encode(), user['password_hash'].encode()):
@@ -118,7 +118,7 @@ def kore_register():
             (name, phone, hashed, location)
         )
         user_id = cur.fetchone()[0]
-        conn.commit(); cur.close(); conn.close()
+        conn.commit(); cur.close()
 
         token = create_access_token(identity=str(user_id))
         return ok({"token": token, "user": {"name": name, "phone": phone, "location": location}})
@@ -145,7 +145,7 @@ def kore_profile():
         cur = conn.cursor(cursor_factory=RealDictCursor)
         cur.execute("SELECT name, phone, location FROM Users WHERE id = %s", (user_id,))
         user = cur.fetchone()
-        cur.close(); conn.close()
+        cur.close()
         if not user:
             return err("User not found.", 404)
         return ok({"user": dict(user)})
@@ -208,7 +208,6 @@ def kore_crop_recommend():
     soil_type = data.get('soil_type', 'Loamy')
     lat       = data.get('lat', 20.0)
     lon       = data.get('lon', 78.0)
-    language  = data.get('language', 'en')
 
     try:
         w = weather_service.get_current_weather(lat, lon)
@@ -240,18 +239,8 @@ def kore_crop_recommend():
         except Exception:
             pass
 
-        # Save to DB
-        conn = get_db()
-        if conn:
-            try:
-                cur = conn.cursor()
-                cur.execute(
-                    "INSERT INTO Recommendations (user_id, latitude, longitude, soil_type, weather_json, recommended_crops, full_response) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-                    (user_id, lat, lon, soil_type, json.dumps(w), json.dumps(crops_out), json.dumps(crops_out))
-                )
-                conn.commit(); cur.close(); conn.close()
-            except Exception:
-                pass
+        # Save to DB (compact layout, written behind the response)
+        recommendation_store.record_kore(user_id, lat, lon, soil_type, w, crops_out)
 
         return ok({
             "soil_type": soil_type,
@@ -309,17 +298,18 @@ def kore_chat():
         verify_jwt_in_request(optional=True)
         user_id = get_jwt_identity()
         if user_id:
-            conn = get_db()
-            if conn:
-                cur = conn.cursor()
-                cur.execute(
-                    "SELECT crop_name FROM Cultivations WHERE user_id=%s AND status='ACTIVE' LIMIT 1",
-                    (user_id,)
-                )
-                res = cur.fetchone()
-                if res:
-                    cultivation_context = res[0]
-                cur.close(); conn.close()
+            # Short-lived connection: it must not stay checked out during the Gemini call
+            with db.connection() as conn:
+                if conn:
+                    cur = conn.cursor()
+                    cur.execute(
+                        "SELECT crop_name FROM Cultivations WHERE user_id=%s AND status='ACTIVE' LIMIT 1",
+                        (user_id,)
+                    )
+                    res = cur.fetchone()
+                    if res:
+                        cultivation_context = res[0]
+                    cur.close()
     except Exception:
         pass
 
@@ -327,15 +317,7 @@ def kore_chat():
 
     # Save chat
     if user_id:
-        try:
-            conn = get_db()
-            if conn:
-                cur = conn.cursor()
-                cur.execute("INSERT INTO Chats (user_id, message, is_bot) VALUES (%s,%s,%s)", (user_id, message, False))
-                cur.execute("INSERT INTO Chats (user_id, message, is_bot) VALUES (%s,%s,%s)", (user_id, reply, True))
-                conn.commit(); cur.close(); conn.close()
-        except Exception:
-            pass
+        write_behind.enqueue("Chats", [(user_id, message, False), (user_id, reply, True)])
 
     return ok({"reply": reply, "language": language})
 
@@ -358,31 +340,36 @@ def kore_start_cultivation():
     if not crop_name:
         return err("crop_name is required.")
 
+    # Resolve the schedule first; the transaction below never waits on Gemini
+    tasks = schedule_templates.get_schedule(crop_name)
+    today = datetime.now().date()
+    schedule_rows = [
+        (t.get('task_name'), today + timedelta(days=t.get('days_from_start', 0)))
+        for t in tasks
+    ]
+
     conn = get_db()
     if not conn:
         return err("Database unavailable.", 500)
 
     try:
         cur = conn.cursor()
-        cur.execute(
-            "UPDATE Cultivations SET status='COMPLETED' WHERE user_id=%s AND status='ACTIVE'",
-            (user_id,)
-        )
-        cur.execute(
-            "INSERT INTO Cultivations (user_id, crop_name) VALUES (%s,%s) RETURNING id",
-            (user_id, crop_name)
-        )
+        cur.execute("""
+            WITH closed AS (
+                UPDATE Cultivations SET status='COMPLETED' WHERE user_id=%s AND status='ACTIVE'
+            )
+            INSERT INTO Cultivations (user_id, crop_name) VALUES (%s,%s) RETURNING id
+        """, (user_id, user_id, crop_name))
         cultivation_id = cur.fetchone()[0]
 
-        tasks = chatbot_engine.generate_cultivation_schedule(crop_name)
-        for t in tasks:
-            due = datetime.now() + timedelta(days=t.get('days_from_start', 0))
-            cur.execute(
-                "INSERT INTO Schedules (cultivation_id, task_name, due_date) VALUES (%s,%s,%s)",
-                (cultivation_id, t.get('task_name'), due.strftime('%Y-%m-%d'))
+        if schedule_rows:
+            execute_values(
+                cur,
+                "INSERT INTO Schedules (cultivation_id, task_name, due_date) VALUES %s",
+                [(cultivation_id, name, due) for name, due in schedule_rows]
             )
 
-        conn.commit(); cur.close(); conn.close()
+        conn.commit(); cur.close()
         return ok({
             "crop_name": crop_name,
             "total_tasks": len(tasks),
@@ -420,7 +407,7 @@ def kore_active_cultivation():
             (active['id'],)
         )
         schedules = cur.fetchall()
-        cur.close(); conn.close()
+        cur.close()
 
         upcoming = []
         overdue  = []
@@ -465,7 +452,7 @@ def kore_complete_task():
     try:
         cur = conn.cursor()
         cur.execute("UPDATE Schedules SET completed=TRUE WHERE id=%s", (task_id,))
-        conn.commit(); cur.close(); conn.close()
+        conn.commit(); cur.close()
         return ok({"message": "Task marked as completed! Great work! ✅"})
     except Exception as e:
         return err(str(e), 500)
@@ -485,7 +472,7 @@ def kore_finish_cultivation():
             "UPDATE Cultivations SET status='COMPLETED' WHERE user_id=%s AND status='ACTIVE'",
             (user_id,)
         )
-        conn.commit(); cur.close(); conn.close()
+        conn.commit(); cur.close()
         return ok({"message": "Congratulations! 🎉 Cultivation marked as complete. Check your profit summary."})
     except Exception as e:
         return err(str(e), 500)
@@ -496,26 +483,29 @@ def kore_finish_cultivation():
 def kore_cultivation_history():
     """
     Past cultivation cycles with profit/loss summary.
-    Returns: list of { crop_name, start_date, net_profit }
+    Query (optional): limit=10, before=<next_before from the previous page>
+    Returns: list of { crop_name, start_date, net_profit }, next_before
     """
     user_id = get_jwt_identity()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    before = request.args.get('before')
+    try:
+        ledger_totals.parse_history_cursor(before)
+    except ValueError:
+        return err("before must be a next_before value.")
+
     conn = get_db()
     if not conn:
         return err("Database unavailable.", 500)
     try:
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute(
-            "SELECT * FROM Cultivations WHERE user_id=%s AND status='COMPLETED' ORDER BY start_date DESC LIMIT 10",
-            (user_id,)
-        )
-        cultivations = cur.fetchall()
+        rows, next_before = ledger_totals.history_page(cur, user_id, limit, before)
+        cur.close()
 
         result = []
-        for c in cultivations:
-            cur.execute("SELECT COALESCE(SUM(amount),0) FROM Ledgers WHERE cultivation_id=%s AND type='PROFIT'", (c['id'],))
-            profit = float(cur.fetchone()['coalesce'])
-            cur.execute("SELECT COALESCE(SUM(amount),0) FROM Ledgers WHERE cultivation_id=%s AND type='EXPENSE'", (c['id'],))
-            expense = float(cur.fetchone()['coalesce'])
+        for c in rows:
+            profit = float(c['profit'])
+            expense = float(c['expense'])
             result.append({
                 "crop_name": c['crop_name'],
                 "start_date": str(c['start_date'])[:10],
@@ -524,8 +514,11 @@ def kore_cultivation_history():
                 "net_profit": profit - expense
             })
 
-        cur.close(); conn.close()
-        return ok({"history": result, "count": len(result)})
+        return ok({
+            "history": result,
+            "count": len(result),
+            "next_before": next_before
+        })
     except Exception as e:
         return err(str(e), 500)
 
@@ -566,11 +559,8 @@ def kore_ledger_add():
         if not active:
             return err("No active cultivation. Please start cultivation first.")
 
-        cur.execute(
-            "INSERT INTO Ledgers (cultivation_id, type, amount, category, notes) VALUES (%s,%s,%s,%s,%s)",
-            (active[0], entry_type, float(amount), category, notes)
-        )
-        conn.commit(); cur.close(); conn.close()
+        ledger_totals.add_entry(cur, active[0], entry_type, float(amount), category, notes)
+        conn.commit(); cur.close()
 
         emoji = "💸" if entry_type == "EXPENSE" else "💰"
         return ok({
@@ -594,24 +584,26 @@ def kore_ledger_summary():
     try:
         cur = conn.cursor(cursor_factory=RealDictCursor)
         cur.execute(
-            "SELECT id, crop_name FROM Cultivations WHERE user_id=%s AND status='ACTIVE' LIMIT 1",
+            "SELECT id, crop_name, total_profit, total_expense FROM Cultivations "
+            "WHERE user_id=%s AND status='ACTIVE' LIMIT 1",
             (user_id,)
         )
         active = cur.fetchone()
         if not active:
             return err("No active cultivation.")
 
+        # Totals cover every entry (maintained on insert); only the preview is limited
         cur.execute(
-            "SELECT type, amount, category, notes, date FROM Ledgers WHERE cultivation_id=%s ORDER BY date DESC LIMIT 20",
+            "SELECT type, amount, category, notes, date FROM Ledgers WHERE cultivation_id=%s ORDER BY date DESC LIMIT 5",
             (active['id'],)
         )
         entries = cur.fetchall()
 
-        total_profit  = sum(float(e['amount']) for e in entries if e['type'] == 'PROFIT')
-        total_expense = sum(float(e['amount']) for e in entries if e['type'] == 'EXPENSE')
+        total_profit  = float(active['total_profit'])
+        total_expense = float(active['total_expense'])
         net = total_profit - total_expense
 
-        cur.close(); conn.close()
+        cur.close()
         return ok({
             "crop_name": active['crop_name'],
             "total_profit": total_profit,
@@ -624,7 +616,7 @@ def kore_ledger_summary():
                     "amount": float(e['amount']),
                     "category": e['category'],
                     "date": str(e['date'])[:10]
-                } for e in entries[:5]
+                } for e in entries
             ]
         })
     except Exception as e:
@@ -660,7 +652,7 @@ def kore_due_tasks():
             WHERE s.due_date = %s AND s.completed = FALSE AND c.status = 'ACTIVE'
         """, (today,))
         rows = cur.fetchall()
-        cur.close(); conn.close()
+        cur.close()
         return ok({"due_today": [dict(r) for r in rows], "count": len(rows)})
     except Exception as e:
         return err(str(e), 500)
@@ -675,10 +667,16 @@ def kore_health():
     """Kore.ai uses this to verify the service is alive."""
     conn = get_db()
     db_ok = conn is not None
-    if conn:
-        conn.close()
     return ok({
         "service": "Smart Kisan Kore.ai API",
         "version": "1.0.0",
-        "db_connected": db_ok
+        "db_connected": db_ok,
+        "db_pool": db.pool_status(),
+        "weather_breaker": weather_service.breaker_status(),
+        "weather_cache": weather_service.cache_stats(),
+        "tts_cache": tts_cache.stats(),
+        "voice_jobs": voice_jobs.stats(),
+        "voice_store": voice_store.stats(),
+        "write_behind": write_behind.stats(),
+        "xai_cache": xai_cache.stats()
     })
@@ -0,0 +1,119 @@
+"""
+ledger_totals.py — Running profit/expense totals per cultivation
+Cultivations.total_profit / total_expense are bumped in the same statement
+that inserts each Ledgers row, so summaries read two columns instead of
+scanning the ledger. reconcile() rebuilds them from the raw rows.
+
+Offline usage:
+    python ledger_totals.py reconcile [cultivation_id ...]   # all when no ids
+"""
+
+import sys
+from datetime import datetime
+
+import db
+
+ENTRY_TYPES = ('PROFIT', 'EXPENSE')
+
+def add_entry(cur, cultivation_id, entry_type, amount, category, notes):
+    """
+    Insert a ledger row and fold it into the cultivation's totals atomically.
+    Returns (total_profit, total_expense) after the insert; the caller commits.
+    """
+    cur.execute("""
+        WITH entry AS (
+            INSERT INTO Ledgers (cultivation_id, type, amount, category, notes)
+            VALUES (%s, %s, %s, %s, %s)
+            RETURNING cultivation_id, type, amount
+        )
+        UPDATE Cultivations c SET
+            total_profit = c.total_profit + CASE WHEN e.type = 'PROFIT' THEN e.amount ELSE 0 END,
+            total_expense = c.total_expense + CASE WHEN e.type = 'EXPENSE' THEN e.amount ELSE 0 END
+        FROM entry e
+        WHERE c.id = e.cultivation_id
+        RETURNING c.total_profit, c.total_expense
+    """, (cultivation_id, entry_type, amount, category, notes))
+    row = cur.fetchone()
+    if isinstance(row, dict):
+        return float(row['total_profit']), float(row['total_expense'])
+    return float(row[0]), float(row[1])
+
+def parse_history_cursor(cursor):
+    """
+    "<start_date>,<id>" -> (start_date, id); None -> (None, 0). A bare
+    start_date (cursors issued before the id was added) pages strictly before it.
+    Raises ValueError for anything else.
+    """
+    if not cursor:
+        return None, 0
+    start_date, _, row_id = cursor.partition(',')
+    datetime.fromisoformat(start_date)
+    return start_date, int(row_id) if row_id else 0
+
+def history_page(cur, user_id, limit, cursor=None):
+    """
+    One page of a user's completed cultivations with their totals, newest first.
+    Ties on start_date are broken by id, so no row is skipped at a page boundary.
+    -> (rows, cursor of the next page or None); raises ValueError for a bad cursor.
+    """
+    before, before_id = parse_history_cursor(cursor)
+    cur.execute("""
+        SELECT id, crop_name, start_date, total_profit AS profit, total_expense AS expense
+        FROM Cultivations
+        WHERE user_id = %s AND status = 'COMPLETED'
+          AND (start_date, id) < (COALESCE(%s::timestamp, 'infinity'), %s)
+        ORDER BY start_date DESC, id DESC
+        LIMIT %s
+    """, (user_id, before, before_id, limit + 1))
+    rows = cur.fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, f"{rows[-1]['start_date']},{rows[-1]['id']}"
+
+def reconcile(cultivation_ids=None):
+    """
+    Recompute totals from Ledgers for the given cultivations (all when None).
+    Returns the ids whose stored totals had drifted and were corrected.
+    """
+    with db.connection() as conn:
+        if not conn:
+            raise RuntimeError("Database unavailable")
+        cur = conn.cursor()
+        # Lock the rows first: a concurrent add_entry() either committed before
+        # the sums are taken or waits and applies its increment on top of them.
+        cur.execute("""
+            SELECT id FROM Cultivations
+            WHERE %(ids)s::int[] IS NULL OR id = ANY(%(ids)s::int[])
+            ORDER BY id FOR UPDATE
+        """, {"ids": cultivation_ids})
+        cur.execute("""
+            UPDATE Cultivations c SET
+                total_profit = s.profit,
+                total_expense = s.expense
+            FROM (
+                SELECT c2.id,
+                       COALESCE(SUM(l.amount) FILTER (WHERE l.type = 'PROFIT'), 0) AS profit,
+                       COALESCE(SUM(l.amount) FILTER (WHERE l.type = 'EXPENSE'), 0) AS expense
+                FROM Cultivations c2
+                LEFT JOIN Ledgers l ON l.cultivation_id = c2.id
+                WHERE %(ids)s::int[] IS NULL OR c2.id = ANY(%(ids)s::int[])
+                GROUP BY c2.id
+            ) s
+            WHERE c.id = s.id
+              AND (c.total_profit, c.total_expense) IS DISTINCT FROM (s.profit, s.expense)
+            RETURNING c.id
+        """, {"ids": cultivation_ids})
+        fixed = sorted(row[0] for row in cur.fetchall())
+        conn.commit()
+        cur.close()
+        return fixed
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "reconcile":
+        ids = [int(arg) for arg in sys.argv[2:]] or None
+        fixed = reconcile(ids)
+        print(f"Reconciled ledger totals: {len(fixed)} cultivation(s) corrected" + (f" {fixed}" if fixed else ""))
+    else:
+        print(__doc__)
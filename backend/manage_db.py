@@ -1,8 +1,23 @@
+"""
+manage_db.py — Versioned schema migrations for Smart Kisan
+Migrations are the numbered files in migrations/ (NNNN_name.sql). Each one is
+applied once, in order, inside its own transaction and recorded in
+SchemaMigrations. app.py runs pending migrations on startup as well.
+
+Usage:
+    python manage_db.py                  # migrate + seed the demo user
+    python manage_db.py migrate          # apply pending migrations
+    python manage_db.py status           # list applied / pending migrations
+    python manage_db.py check-indexes    # EXPLAIN the hot queries, fail on unindexed scans
+    python manage_db.py partitions [--dry-run]   # pre-create months, empty the DEFAULT partition, apply guest retention
+"""
 
 import psycopg2
 import os
+import re
+import sys
+import json
 from dotenv import load_dotenv
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 
 load_dotenv()
 
@@ -14,90 +29,297 @@ DB_CONFIG = {
     "port": os.getenv("DB_PORT", "5432")
 }
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+# pg_advisory_lock key, so concurrent workers/deploys never migrate at the same time
+MIGRATION_LOCK_ID = 720160
+PARTITION_LOCK_ID = 720161
+
+# Recommendations partitions (migration 0005): months created ahead of time,
+# and how long guest (user_id NULL) partitions are kept before being
+# detached (left as standalone tables for archiving) or dropped.
+REC_PARTITION_MONTHS_AHEAD = int(os.getenv("REC_PARTITION_MONTHS_AHEAD", "3"))
+GUEST_RETENTION_MONTHS = int(os.getenv("GUEST_RETENTION_MONTHS", "6"))
+GUEST_RETENTION_ACTION = os.getenv("GUEST_RETENTION_ACTION", "detach")   # detach | drop
+
 def get_connection():
     return psycopg2.connect(**DB_CONFIG)
 
-def add_column_if_not_exists(cur, table, column, data_type):
+def load_migrations():
+    """[(version, name, path), ...] sorted by version."""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    versions = [m[0] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {MIGRATIONS_DIR}")
+    return migrations
+
+def _applied_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS SchemaMigrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("SELECT version FROM SchemaMigrations")
+    return {row[0] for row in cur.fetchall()}
+
+def migrate(conn=None, verbose=True):
+    """
+    Apply pending migrations in version order. Uses `conn` when given
+    (e.g. a pooled connection at app startup), otherwise opens its own.
+    Returns the versions applied by this call.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    cur = conn.cursor()
+    applied = []
     try:
-        cur.execute(f"""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='{table.lower()}' AND column_name='{column}';
-        """)
-        if not cur.fetchone():
-            print(f"Adding '{column}' column to '{table}'...")
-            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {data_type};")
-        else:
-            print(f"Column '{column}' already exists in '{table}'.")
-    except Exception as e:
-        print(f"Error checking/adding column {column}: {e}")
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            done = _applied_versions(cur)
+            conn.commit()
+            for version, name, path in load_migrations():
+                if version in done:
+                    continue
+                if verbose:
+                    print(f"Applying migration {version:04d}_{name}...")
+                with open(path, "r", encoding="utf-8") as f:
+                    cur.execute(f.read())
+                cur.execute("INSERT INTO SchemaMigrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+                applied.append(version)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    finally:
+        cur.close()
+        if own_conn:
+            conn.close()
+    if verbose:
+        print(f"Migrations applied: {applied}" if applied else "Database schema is up to date.")
+    return applied
 
-def migrate():
-    print("Starting Database Migration...")
+def ensure_partitions(conn, months_ahead=None):
+    """
+    Create Recommendations partitions for this month and the next few, plus
+    any month whose rows fell into recommendations_default (they are moved
+    into the new partition). Returns the new names.
+    """
+    months_ahead = REC_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    cur = conn.cursor()
     try:
-        conn = get_connection()
-        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_ID,))
+        cur.execute("""
+            SELECT to_char(m, 'YYYY_MM') FROM (
+                SELECT generate_series(
+                    date_trunc('month', CURRENT_TIMESTAMP),
+                    date_trunc('month', CURRENT_TIMESTAMP) + make_interval(months => %s),
+                    INTERVAL '1 month'
+                ) AS m
+                UNION
+                SELECT DISTINCT date_trunc('month', timestamp) FROM recommendations_default
+            ) months
+            WHERE recommendations_ensure_partition(m::date)
+            ORDER BY 1
+        """, (months_ahead,))
+        created = [f"recommendations_{row[0]}" for row in cur.fetchall()]
+        conn.commit()
+        return created
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def expired_guest_partitions(cur, retention_months=None):
+    """Attached guest partitions whose whole month is older than the retention window."""
+    retention_months = GUEST_RETENTION_MONTHS if retention_months is None else retention_months
+    cur.execute("""
+        SELECT child.relname, parent.relname
+        FROM pg_partition_tree('recommendations') t
+        JOIN pg_class child ON child.oid = t.relid
+        JOIN pg_class parent ON parent.oid = t.parentrelid
+        WHERE t.isleaf AND child.relname ~ '^recommendations_[0-9]{4}_[0-9]{2}_guests$'
+          AND to_date(substr(child.relname, 17, 7), 'YYYY_MM') + INTERVAL '1 month'
+              <= date_trunc('month', CURRENT_TIMESTAMP) - make_interval(months => %s)
+        ORDER BY child.relname
+    """, (retention_months,))
+    return cur.fetchall()
+
+def maintain_partitions(dry_run=False):
+    """Pre-create upcoming months, then detach or drop expired guest partitions."""
+    if GUEST_RETENTION_ACTION not in ("detach", "drop"):
+        raise ValueError("GUEST_RETENTION_ACTION must be 'detach' or 'drop'")
+    conn = get_connection()
+    try:
+        if not dry_run:
+            for name in ensure_partitions(conn):
+                print(f"Created partition {name}")
         cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_ID,))
+        cur.execute("SELECT COUNT(*) FROM recommendations_default")
+        stray = cur.fetchone()[0]
+        if stray:
+            print(f"{stray} row(s) in recommendations_default" +
+                  (" (run without --dry-run to move them into monthly partitions)" if dry_run else ""))
+        expired = expired_guest_partitions(cur)
+        if not expired:
+            print(f"No guest partitions older than {GUEST_RETENTION_MONTHS} month(s).")
+        for child, parent in expired:
+            verb = {"detach": "Detaching", "drop": "Dropping"}[GUEST_RETENTION_ACTION]
+            print(f"{'Would be ' + verb.lower() if dry_run else verb} {child}")
+            if dry_run:
+                continue
+            cur.execute(f'ALTER TABLE "{parent}" DETACH PARTITION "{child}"')
+            if GUEST_RETENTION_ACTION == "drop":
+                cur.execute(f'DROP TABLE "{child}"')
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
 
-        # 1. Create Users Table
-        print("--- Checking 'Users' Table ---")
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS Users (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100),
-                phone VARCHAR(20) UNIQUE,
-                location VARCHAR(100),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-
-        # 2. Update Users Columns
-        add_column_if_not_exists(cur, 'Users', 'location', 'VARCHAR(100)')
-        add_column_if_not_exists(cur, 'Users', 'password_hash', 'VARCHAR(255)')
-        add_column_if_not_exists(cur, 'Users', 'profile_pic', 'TEXT')
-
-        # 3. Create Recommendations Table (Ensure it exists for column check)
-        # (Assuming it's created by app.py or schema.sql, but safer to have stub if critical)
-        # Skipped full creation here to avoid conflict with complex schema, but dealing with modification:
-        
-        print("--- Checking 'Recommendations' Table ---")
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS Recommendations (
-                id SERIAL PRIMARY KEY,
-                user_id INT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                latitude FLOAT,
-                longitude FLOAT,
-                soil_type VARCHAR(50),
-                weather_json JSONB,
-                recommended_crops JSONB,
-                full_response JSONB
-            );
-        """)
-        
-        # Index for faster history retrieval
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_rec_timestamp ON Recommendations(timestamp DESC);")
-
-        # Now check for specific columns just in case table existed but was old version
-        add_column_if_not_exists(cur, 'Recommendations', 'full_response', 'JSONB')
-
-        # 4. Seed Data
-        print("--- Seeding Data ---")
+def status():
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('SchemaMigrations')")
+        done = {}
+        if cur.fetchone()[0]:
+            cur.execute("SELECT version, applied_at FROM SchemaMigrations")
+            done = dict(cur.fetchall())
+        for version, name, _ in load_migrations():
+            state = f"applied {done[version]:%Y-%m-%d %H:%M}" if version in done else "pending"
+            print(f"  {version:04d}_{name:<30} {state}")
+        cur.close()
+    finally:
+        conn.close()
+
+def seed():
+    """Demo user (ID=1) used by the sample data."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
         cur.execute("SELECT id FROM Users WHERE id = 1;")
         if not cur.fetchone():
-            try:
-                cur.execute("INSERT INTO Users (id, name, phone, location) VALUES (1, 'Siva Kumar', '9876543210', 'Andhra Pradesh');")
+            cur.execute("INSERT INTO Users (id, name, phone, location) VALUES (1, 'Siva Kumar', '9876543210', 'Andhra Pradesh') ON CONFLICT DO NOTHING;")
+            if cur.rowcount:
+                # Explicit id: move the sequence past it so the next signup doesn't collide
+                cur.execute("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT MAX(id) FROM Users))")
                 print("Default user (ID=1) created.")
-            except Exception as e:
-                 print(f"Skipping default user creation (might exist with different ID): {e}")
-
+            else:
+                print("Skipping default user creation (phone already registered).")
         conn.commit()
         cur.close()
+    finally:
         conn.close()
-        print("\n✅ Database Migration Completed Successfully!")
 
-    except Exception as e:
-        print(f"\n❌ Migration Failed: {e}")
+# --- Index check ---
+# The queries behind the hot endpoints, with representative parameters.
+# Each must be answerable through an index on the tables listed.
+HOT_QUERIES = [
+    ("/history", ["recommendations"],
+     "SELECT recommended_crops, timestamp, soil_type, weather_json, details, full_response FROM Recommendations "
+     "WHERE user_id = %s ORDER BY timestamp DESC, id DESC LIMIT 20", (1,)),
+    ("/history explanations", ["explanationtexts"],
+     "SELECT hash, text FROM ExplanationTexts WHERE hash = ANY(%s)", (["0" * 64],)),
+    ("/chat_history etag", ["chats"],
+     "SELECT MAX(id) FROM Chats WHERE user_id = %s AND id < COALESCE(%s, 2147483647)", (1, None)),
+    ("/chat_history page", ["chats"],
+     "SELECT id, message, is_bot FROM Chats WHERE user_id = %s AND id < COALESCE(%s, 2147483647) "
+     "ORDER BY id DESC LIMIT 51", (1, None)),
+    ("active cultivation", ["cultivations"],
+     "SELECT * FROM Cultivations WHERE user_id = %s AND status = 'ACTIVE' LIMIT 1", (1,)),
+    ("cultivation history", ["cultivations"],
+     "SELECT id, crop_name, start_date, total_profit, total_expense FROM Cultivations "
+     "WHERE user_id = %s AND status = 'COMPLETED' AND (start_date, id) < ('infinity'::timestamp, 0) "
+     "ORDER BY start_date DESC, id DESC LIMIT 51", (1,)),
+    ("cultivation schedules", ["schedules"],
+     "SELECT * FROM Schedules WHERE cultivation_id = %s ORDER BY due_date", (1,)),
+    ("cultivation ledger", ["ledgers"],
+     "SELECT * FROM Ledgers WHERE cultivation_id = %s ORDER BY date DESC", (1,)),
+    ("ledger summary preview", ["ledgers"],
+     "SELECT type, amount, category, notes, date FROM Ledgers WHERE cultivation_id = %s "
+     "ORDER BY date DESC LIMIT 5", (1,)),
+    ("/notifications/due_tasks", ["schedules", "cultivations"],
+     "SELECT u.phone, u.name, s.task_name, c.crop_name FROM Schedules s "
+     "JOIN Cultivations c ON s.cultivation_id = c.id JOIN Users u ON c.user_id = u.id "
+     "WHERE s.due_date = CURRENT_DATE AND s.completed = FALSE AND c.status = 'ACTIVE'", ()),
+]
+
+def _unindexed_scans(plan):
+    """
+    Relations in an EXPLAIN (FORMAT JSON) plan that are read without an index
+    condition: sequential scans, or full index walks that filter rows out.
+    (A full walk of a partial index with no filter reads only matching rows.)
+    """
+    found = []
+    node = plan.get("Node Type")
+    relation = plan.get("Relation Name", "").lower()
+    full_walk = node in ("Index Scan", "Index Only Scan") and "Index Cond" not in plan and "Filter" in plan
+    if node == "Seq Scan" or full_walk:
+        found.append(relation)
+    for child in plan.get("Plans", []):
+        found.extend(_unindexed_scans(child))
+    return found
+
+def check_indexes():
+    """
+    EXPLAIN every hot query and report tables it reads without an index
+    condition. Seq scans are disabled for the check, so even on a small dev
+    database the plan shows whether a usable index exists. Returns True if all pass.
+    """
+    conn = get_connection()
+    failures = 0
+    try:
+        cur = conn.cursor()
+        cur.execute("SET enable_seqscan = off")
+        for name, tables, sql, params in HOT_QUERIES:
+            cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            # Partitions are named after their table (recommendations_2026_01_users, ...)
+            scanned = [t for t in _unindexed_scans(plan[0]["Plan"])
+                       if any(t == name or t.startswith(name + "_") for name in tables)]
+            if scanned:
+                failures += 1
+                print(f"  FAIL {name}: no index condition on {', '.join(sorted(set(scanned)))}")
+            else:
+                print(f"  ok   {name}")
+        cur.close()
+    finally:
+        conn.rollback()
+        conn.close()
+    print("All hot queries use an index." if not failures else f"{failures} hot query(ies) without an index.")
+    return failures == 0
 
 if __name__ == "__main__":
-    migrate()
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    try:
+        if command == "migrate":
+            migrate()
+        elif command == "status":
+            status()
+        elif command == "partitions":
+            maintain_partitions(dry_run="--dry-run" in sys.argv[2:])
+        elif command == "check-indexes":
+            sys.exit(0 if check_indexes() else 1)
+        elif command == "":
+            print("Starting Database Migration...")
+            migrate()
+            seed()
+            print("\n✅ Database Migration Completed Successfully!")
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"\n❌ Migration Failed: {e}")
+        sys.exit(1)
@@ -1,10 +1,20 @@
--- Users table (Optional for now, but good practice)
+-- 0001 — Base tables
+-- Everything is IF NOT EXISTS so databases created by the old schema.sql /
+-- manage_db.py adopt this baseline without changes.
+
+-- Users
 CREATE TABLE IF NOT EXISTS Users (
     id SERIAL PRIMARY KEY,
     name VARCHAR(100),
     phone VARCHAR(20) UNIQUE,
+    location VARCHAR(100),
+    password_hash VARCHAR(255),
+    profile_pic TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+ALTER TABLE Users ADD COLUMN IF NOT EXISTS location VARCHAR(100);
+ALTER TABLE Users ADD COLUMN IF NOT EXISTS password_hash VARCHAR(255);
+ALTER TABLE Users ADD COLUMN IF NOT EXISTS profile_pic TEXT;
 
 -- Recommendations History
 CREATE TABLE IF NOT EXISTS Recommendations (
@@ -19,6 +29,8 @@ CREATE TABLE IF NOT EXISTS Recommendations (
     full_response JSONB -- Stores the complete API response for exact reproduction
 );
 
+ALTER TABLE Recommendations ADD COLUMN IF NOT EXISTS full_response JSONB;
+
 -- Index for faster history retrieval
 CREATE INDEX IF NOT EXISTS idx_rec_timestamp ON Recommendations(timestamp DESC);
 
@@ -62,3 +74,11 @@ CREATE TABLE IF NOT EXISTS Chats (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
 );
+
+-- Cached Gemini crop explanations (see xai_cache.py)
+CREATE TABLE IF NOT EXISTS ExplanationCache (
+    cache_key VARCHAR(255) PRIMARY KEY, -- crop|soil|weather buckets|language
+    text TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_explanation_cache_created ON ExplanationCache(created_at);
@@ -0,0 +1,26 @@
+-- 0002 — Running ledger totals per cultivation
+-- Kept in step with every Ledgers insert.
+-- Backfilled once from the raw rows when the columns are first added;
+-- `python ledger_totals.py reconcile` rebuilds them at any time.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'cultivations' AND column_name = 'total_profit'
+    ) THEN
+        ALTER TABLE Cultivations
+            ADD COLUMN total_profit DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            ADD COLUMN total_expense DECIMAL(14, 2) NOT NULL DEFAULT 0;
+        UPDATE Cultivations c SET
+            total_profit = s.profit,
+            total_expense = s.expense
+        FROM (
+            SELECT cultivation_id,
+                   COALESCE(SUM(amount) FILTER (WHERE type = 'PROFIT'), 0) AS profit,
+                   COALESCE(SUM(amount) FILTER (WHERE type = 'EXPENSE'), 0) AS expense
+            FROM Ledgers GROUP BY cultivation_id
+        ) s
+        WHERE c.id = s.cultivation_id;
+    END IF;
+END $$;
@@ -0,0 +1,25 @@
+-- 0003 — Indexes for the hot lookup paths
+-- `python manage_db.py check-indexes` EXPLAINs each endpoint query against these.
+
+-- /history: WHERE user_id = ? ORDER BY timestamp DESC LIMIT 20
+CREATE INDEX IF NOT EXISTS idx_rec_user_time ON Recommendations(user_id, timestamp DESC);
+
+-- /chat_history: WHERE user_id = ? ORDER BY id
+CREATE INDEX IF NOT EXISTS idx_chats_user_id ON Chats(user_id, id);
+
+-- Active cultivation lookups (at most one ACTIVE row per user, so keep the index tiny)
+CREATE INDEX IF NOT EXISTS idx_cult_user_active ON Cultivations(user_id) WHERE status = 'ACTIVE';
+
+-- Cultivation history: WHERE user_id = ? AND status = 'COMPLETED' ORDER BY start_date DESC
+CREATE INDEX IF NOT EXISTS idx_cult_user_completed
+    ON Cultivations(user_id, start_date DESC) WHERE status = 'COMPLETED';
+
+-- Schedules of one cultivation, in due order
+CREATE INDEX IF NOT EXISTS idx_sched_cult_due ON Schedules(cultivation_id, due_date);
+
+-- /kore/v1/notifications/due_tasks: open tasks due on a given day
+CREATE INDEX IF NOT EXISTS idx_sched_open_due
+    ON Schedules(due_date) INCLUDE (cultivation_id, task_name) WHERE completed = FALSE;
+
+-- Ledger entries of one cultivation, newest first (totals live on Cultivations)
+CREATE INDEX IF NOT EXISTS idx_ledgers_cult_date ON Ledgers(cultivation_id, date DESC);
@@ -0,0 +1,11 @@
+-- 0004 — Compact Recommendations storage (see recommendation_store.py)
+-- Explanation text is stored once, keyed by its SHA-256; compact rows keep
+-- hashes in recommended_crops, rebuild inputs in `details`, and no full_response.
+-- Existing rows are converted by `python recommendation_store.py backfill`.
+
+CREATE TABLE IF NOT EXISTS ExplanationTexts (
+    hash VARCHAR(64) PRIMARY KEY, -- sha256 hex of the UTF-8 text
+    text TEXT NOT NULL
+);
+
+ALTER TABLE Recommendations ADD COLUMN IF NOT EXISTS details JSONB;
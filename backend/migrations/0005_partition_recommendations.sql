@@ -0,0 +1,68 @@
+-- 0005 — Partition Recommendations by month
+-- Each month is a partition of Recommendations, split again by user_id:
+--   recommendations_YYYY_MM_guests  user_id IS NULL (dropped/detached by retention)
+--   recommendations_YYYY_MM_users   everything else, indexed on (user_id, timestamp DESC)
+-- `python manage_db.py partitions` pre-creates upcoming months and applies
+-- the guest retention policy; app startup pre-creates upcoming months too.
+-- A partitioned table's unique keys must contain every partition column, and
+-- user_id is nullable, so the primary key on id lives on each leaf instead.
+
+CREATE OR REPLACE FUNCTION recommendations_ensure_partition(month_start DATE) RETURNS BOOLEAN AS $$
+DECLARE
+    m DATE := date_trunc('month', month_start)::date;
+    part TEXT := 'recommendations_' || to_char(m, 'YYYY_MM');
+BEGIN
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    EXECUTE format('CREATE TABLE %I PARTITION OF Recommendations FOR VALUES FROM (%L) TO (%L) PARTITION BY LIST (user_id)',
+                   part, m, (m + INTERVAL '1 month')::date);
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES IN (NULL)', part || '_guests', part);
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', part || '_users', part);
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id)', part || '_guests');
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id)', part || '_users');
+    EXECUTE format('CREATE INDEX %I ON %I (user_id, timestamp DESC)', part || '_users_user_time', part || '_users');
+    RETURN TRUE;
+END
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE Recommendations RENAME TO recommendations_unpartitioned;
+ALTER SEQUENCE recommendations_id_seq OWNED BY NONE;
+
+CREATE TABLE Recommendations (
+    id INT NOT NULL DEFAULT nextval('recommendations_id_seq'),
+    user_id INT, -- Can be NULL for guest users
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    latitude FLOAT,
+    longitude FLOAT,
+    soil_type VARCHAR(50),
+    weather_json JSONB, -- Stores temp, humidity, rainfall, etc.
+    recommended_crops JSONB, -- Compact crop list (see recommendation_store.py) or the old full list
+    full_response JSONB, -- Old layout only; compact rows rebuild it on read
+    details JSONB -- Inputs needed to rebuild a compact row's response
+) PARTITION BY RANGE (timestamp);
+ALTER SEQUENCE recommendations_id_seq OWNED BY Recommendations.id;
+
+-- Partitions for every month with data, plus the next three
+DO $$
+DECLARE
+    m DATE;
+    last_month DATE;
+BEGIN
+    SELECT date_trunc('month', LEAST(MIN(timestamp), CURRENT_TIMESTAMP))::date,
+           date_trunc('month', GREATEST(MAX(timestamp), CURRENT_TIMESTAMP + INTERVAL '3 months'))::date
+    INTO m, last_month
+    FROM recommendations_unpartitioned;
+    WHILE m <= last_month LOOP
+        PERFORM recommendations_ensure_partition(m);
+        m := (m + INTERVAL '1 month')::date;
+    END LOOP;
+END $$;
+
+INSERT INTO Recommendations (id, user_id, timestamp, latitude, longitude, soil_type,
+                             weather_json, recommended_crops, full_response, details)
+SELECT id, user_id, COALESCE(timestamp, CURRENT_TIMESTAMP), latitude, longitude, soil_type,
+       weather_json, recommended_crops, full_response, details
+FROM recommendations_unpartitioned;
+
+DROP TABLE recommendations_unpartitioned;
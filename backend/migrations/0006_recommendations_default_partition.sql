@@ -0,0 +1,49 @@
+-- 0006 — DEFAULT partition for Recommendations
+-- Rows for a month without a partition (e.g. the pre-created horizon ran out
+-- because `manage_db.py partitions` stopped running) land here instead of
+-- failing the insert. recommendations_ensure_partition() now moves such rows
+-- into the month's partition when it creates it; `manage_db.py partitions`
+-- (and app startup) creates partitions for every month found in here.
+
+CREATE TABLE IF NOT EXISTS recommendations_default PARTITION OF Recommendations DEFAULT;
+ALTER TABLE recommendations_default ADD PRIMARY KEY (id);
+CREATE INDEX IF NOT EXISTS recommendations_default_user_time ON recommendations_default (user_id, timestamp DESC);
+
+-- Attaching a range partition fails while the DEFAULT partition holds rows
+-- for that range, so those rows are parked in a temp table around the CREATE.
+CREATE OR REPLACE FUNCTION recommendations_ensure_partition(month_start DATE) RETURNS BOOLEAN AS $$
+DECLARE
+    m DATE := date_trunc('month', month_start)::date;
+    next_m DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::date;
+    part TEXT := 'recommendations_' || to_char(m, 'YYYY_MM');
+    parked BOOLEAN;
+BEGIN
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+
+    parked := EXISTS (SELECT 1 FROM recommendations_default WHERE timestamp >= m AND timestamp < next_m);
+    IF parked THEN
+        DROP TABLE IF EXISTS pg_temp.recommendations_parked;
+        CREATE TEMP TABLE recommendations_parked (LIKE recommendations_default) ON COMMIT DROP;
+        WITH moved AS (
+            DELETE FROM recommendations_default WHERE timestamp >= m AND timestamp < next_m RETURNING *
+        )
+        INSERT INTO recommendations_parked SELECT * FROM moved;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I PARTITION OF Recommendations FOR VALUES FROM (%L) TO (%L) PARTITION BY LIST (user_id)',
+                   part, m, next_m);
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES IN (NULL)', part || '_guests', part);
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', part || '_users', part);
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id)', part || '_guests');
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id)', part || '_users');
+    EXECUTE format('CREATE INDEX %I ON %I (user_id, timestamp DESC)', part || '_users_user_time', part || '_users');
+
+    IF parked THEN
+        INSERT INTO Recommendations SELECT * FROM recommendations_parked;
+        DROP TABLE pg_temp.recommendations_parked;
+    END IF;
+    RETURN TRUE;
+END
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,6 @@
+-- 0007 — Cultivation history pages by (start_date, id)
+-- Several cultivations can share a start_date, so the history cursor carries
+-- the id as a tie-breaker; the index orders by both so a page stays one range scan.
+CREATE INDEX IF NOT EXISTS idx_cult_user_completed_id
+    ON Cultivations(user_id, start_date DESC, id DESC) WHERE status = 'COMPLETED';
+DROP INDEX IF EXISTS idx_cult_user_completed;
@@ -6,6 +6,10 @@ from PIL import Image
 import io
 import os
 import gc
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
 
 try:
     import tflite_runtime.interpreter as tflite
@@ -19,14 +23,17 @@ CROP_MODEL_PATH = os.path.join(MODEL_DIR, "crop_model.pkl")
 SOIL_MODEL_PATH = os.path.join(MODEL_DIR, "soil_model.tflite")
 MAPPING_PATH = os.path.join(MODEL_DIR, "soil_npk_mapping.json")
 
+# Set CROP_FAST_PATH=0 to always go through sklearn's predict_proba
+CROP_FAST_PATH = os.getenv("CROP_FAST_PATH", "1") != "0"
+
 # Global variables for models
 crop_model = None
-soil_model = None
+crop_forest = None  # flat NumPy form of crop_model, see compile_crop_forest()
 soil_classes = None
 npk_mapping = None
 
 def load_resources():
-    global crop_model, npk_mapping
+    global crop_model, crop_forest, npk_mapping
     print("Loading ML Resources...")
     
     try:
@@ -36,9 +43,17 @@ def load_resources():
     except Exception as e:
         print(f"Failed to load crop model: {e}")
 
+    if crop_model is not None and CROP_FAST_PATH:
+        try:
+            crop_forest = compile_crop_forest(crop_model)
+            print(f"Crop Model compiled for fast inference ({crop_forest['n_trees']} trees).")
+        except Exception as e:
+            crop_forest = None
+            print(f"Crop fast path disabled, using sklearn: {e}")
+
     # LAZY LOAD: Soil model NOT loaded at startup to save memory
-    # It will be loaded on-demand when image analysis is requested
-    print("Soil Model will be loaded on-demand (lazy loading)")
+    # Interpreters are created on demand by the soil pool and evicted when idle
+    print("Soil Model will be loaded on-demand (pooled, idle-evicted)")
 
     try:
         with open(MAPPING_PATH, "r") as f:
@@ -48,55 +63,315 @@ def load_resources():
     except Exception as e:
         print(f"Failed to load NPK mapping: {e}")
 
-def load_soil_model_lazy():
-    """Load soil model only when needed"""
-    global soil_model, soil_classes
-    
-    if soil_model is not None:
-        return  # Already loaded
-    
+# --- Soil interpreter pool ---
+# Interpreters are created on demand up to SOIL_POOL_SIZE, reused across
+# requests, and evicted after SOIL_POOL_IDLE_SECONDS without use so an idle
+# server drops back to holding no soil model at all.
+SOIL_POOL_SIZE = int(os.getenv("SOIL_POOL_SIZE", "2"))
+SOIL_POOL_IDLE_SECONDS = float(os.getenv("SOIL_POOL_IDLE_SECONDS", "300"))
+SOIL_POOL_TIMEOUT = float(os.getenv("SOIL_POOL_TIMEOUT", "30"))
+SOIL_NUM_THREADS = int(os.getenv("SOIL_NUM_THREADS", "1"))
+
+# Soil image limits; the model input is SOIL_IMG_SIZE x SOIL_IMG_SIZE RGB
+SOIL_IMG_SIZE = 150
+SOIL_MAX_IMAGE_BYTES = int(os.getenv("SOIL_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+SOIL_MAX_PIXELS = int(os.getenv("SOIL_MAX_PIXELS", "50000000"))
+
+class ImageTooLarge(ValueError):
+    """The soil photo is over SOIL_MAX_IMAGE_BYTES or SOIL_MAX_PIXELS."""
+
+_soil_buffers = threading.local()  # per-thread preprocessing / batch input buffers
+_soil_idle = []          # [(interpreter, last_used_monotonic)], most recent last
+_soil_created = 0        # interpreters alive (idle + checked out)
+_soil_cond = threading.Condition()
+_soil_evictor = None
+
+def load_soil_classes():
+    """Load the class-index -> soil name map once."""
+    global soil_classes
+    if soil_classes is not None:
+        return
     try:
-        print("Lazy-loading Soil Model (TFLite)...")
-        # Use num_threads=1 to restrict CPU and memory usage
-        soil_model = tflite.Interpreter(model_path=SOIL_MODEL_PATH, num_threads=1)
-        soil_model.allocate_tensors()
-        
-        # Load classes
         with open(os.path.join(MODEL_DIR, "soil_classes.json"), "r") as f:
             indices = json.load(f)
             soil_classes = {v: k for k, v in indices.items()}
-        
-        print("Soil Model loaded successfully.")
     except Exception as e:
-        print(f"Failed to lazy-load soil model: {e}")
+        print(f"Failed to load soil classes: {e}")
+
+def _create_soil_interpreter():
+    print(f"Loading Soil Model (TFLite, num_threads={SOIL_NUM_THREADS})...")
+    interpreter = tflite.Interpreter(model_path=SOIL_MODEL_PATH, num_threads=SOIL_NUM_THREADS)
+    interpreter.allocate_tensors()
+    return interpreter
+
+def _start_soil_evictor():
+    global _soil_evictor
+    if _soil_evictor is not None and _soil_evictor.is_alive():
+        return
+    _soil_evictor = threading.Thread(target=_evict_idle_soil_interpreters, name="soil-pool-evictor", daemon=True)
+    _soil_evictor.start()
+
+def _evict_idle_soil_interpreters():
+    global _soil_created
+    interval = max(1.0, min(SOIL_POOL_IDLE_SECONDS / 2, 30.0))
+    while True:
+        time.sleep(interval)
+        now = time.monotonic()
+        with _soil_cond:
+            keep = [(i, t) for i, t in _soil_idle if now - t < SOIL_POOL_IDLE_SECONDS]
+            evicted = len(_soil_idle) - len(keep)
+            _soil_idle[:] = keep
+            _soil_created -= evicted
+            if evicted:
+                _soil_cond.notify_all()
+        if evicted:
+            print(f"Soil pool: evicted {evicted} idle interpreter(s)")
+            gc.collect()
 
-def predict_soil_from_image(image_bytes):
+def _soil_input_batch(interpreter):
+    return int(interpreter.get_input_details()[0]['shape'][0])
+
+def acquire_soil_interpreter(batch_size=None):
     """
-    Predicts soil type from image bytes.
+    Check out a ready interpreter, creating one if the pool has room.
+    Idle interpreters whose input is already sized for `batch_size` are preferred.
+    Blocks up to SOIL_POOL_TIMEOUT when all SOIL_POOL_SIZE are busy; returns None on failure.
     """
-    global soil_model
-    # Lazy load soil model when needed
-    load_soil_model_lazy()
-    
-    if soil_model is None:
-        return "Unknown", 0.0
+    global _soil_created
+    load_soil_classes()
+    deadline = time.monotonic() + SOIL_POOL_TIMEOUT
+    with _soil_cond:
+        while True:
+            if _soil_idle:
+                if batch_size is not None:
+                    for i in range(len(_soil_idle) - 1, -1, -1):
+                        if _soil_input_batch(_soil_idle[i][0]) == batch_size:
+                            return _soil_idle.pop(i)[0]
+                return _soil_idle.pop()[0]
+            if _soil_created < SOIL_POOL_SIZE:
+                _soil_created += 1
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print("Soil pool: timed out waiting for an interpreter")
+                return None
+            _soil_cond.wait(remaining)
 
+    # Build outside the lock so other threads can keep using idle interpreters
     try:
-        # Preprocess
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        img = img.resize((150, 150))
-        img_array = np.array(img, dtype=np.float32)
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array /= 255.0
-
-        # Predict using TFLite
-        input_details = soil_model.get_input_details()
-        output_details = soil_model.get_output_details()
-        
-        soil_model.set_tensor(input_details[0]['index'], img_array)
-        soil_model.invoke()
-        preds = soil_model.get_tensor(output_details[0]['index'])
-        
+        interpreter = _create_soil_interpreter()
+    except Exception as e:
+        print(f"Failed to load soil model: {e}")
+        with _soil_cond:
+            _soil_created -= 1
+            _soil_cond.notify()
+        return None
+    _start_soil_evictor()
+    return interpreter
+
+def release_soil_interpreter(interpreter):
+    with _soil_cond:
+        _soil_idle.append((interpreter, time.monotonic()))
+        _soil_cond.notify()
+
+def soil_pool_status():
+    with _soil_cond:
+        return {"size": SOIL_POOL_SIZE, "loaded": _soil_created, "idle": len(_soil_idle)}
+
+# --- Soil micro-batching ---
+# Concurrent uploads are coalesced: the dispatcher waits up to
+# SOIL_BATCH_WINDOW_MS for more images (at most SOIL_BATCH_MAX) and runs a
+# single invoke. Batches are padded to a power of two (capped at
+# SOIL_BATCH_MAX) so an interpreter's input, which costs a tensor
+# reallocation to resize, only ever takes a few shapes.
+# SOIL_BATCH_MAX=1 turns batching off.
+SOIL_BATCH_MAX = int(os.getenv("SOIL_BATCH_MAX", "8"))
+SOIL_BATCH_WINDOW_MS = float(os.getenv("SOIL_BATCH_WINDOW_MS", "5"))
+
+_soil_queue = queue.Queue()
+_soil_dispatcher = None
+_soil_dispatcher_lock = threading.Lock()
+_soil_batch_executor = None
+# Cleared the first time the model rejects a resized batch input; from then
+# on batches are scored image by image without retrying the resize
+_soil_dynamic_batch = True
+
+def _soil_batch_bucket(n):
+    """Interpreter batch size for n images: the next power of two, capped at SOIL_BATCH_MAX."""
+    size = 1
+    while size < n:
+        size *= 2
+    return max(n, min(size, SOIL_BATCH_MAX))
+
+def _soil_invoke(interpreter, batch):
+    """Run one invoke over an (n, SOIL_IMG_SIZE, SOIL_IMG_SIZE, 3) batch, resizing the input if needed."""
+    input_details = interpreter.get_input_details()
+    output_details = interpreter.get_output_details()
+
+    if tuple(input_details[0]['shape']) != batch.shape:
+        interpreter.resize_tensor_input(input_details[0]['index'], batch.shape)
+        interpreter.allocate_tensors()
+
+    interpreter.set_tensor(input_details[0]['index'], batch)
+    interpreter.invoke()
+    return interpreter.get_tensor(output_details[0]['index'])
+
+def _start_soil_dispatcher():
+    global _soil_dispatcher, _soil_batch_executor
+    if _soil_dispatcher is not None and _soil_dispatcher.is_alive():
+        return
+    with _soil_dispatcher_lock:
+        if _soil_dispatcher is not None and _soil_dispatcher.is_alive():
+            return
+        # One batch per pooled interpreter can run at a time
+        _soil_batch_executor = ThreadPoolExecutor(max_workers=SOIL_POOL_SIZE, thread_name_prefix="soil-batch")
+        _soil_dispatcher = threading.Thread(target=_soil_dispatch_loop, name="soil-batch-dispatcher", daemon=True)
+        _soil_dispatcher.start()
+
+def _soil_dispatch_loop():
+    window = SOIL_BATCH_WINDOW_MS / 1000.0
+    while True:
+        batch = [_soil_queue.get()]
+        deadline = time.monotonic() + window
+        while len(batch) < SOIL_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_soil_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        _soil_batch_executor.submit(_run_soil_batch, batch)
+
+def _run_soil_batch(batch):
+    """Classify a list of (image_array, Future) pairs with one interpreter call."""
+    global _soil_dynamic_batch
+    # Callers that timed out cancelled their future; skip those images
+    batch = [(img, future) for img, future in batch if future.set_running_or_notify_cancel()]
+    if not batch:
+        return
+    n = len(batch)
+    size = _soil_batch_bucket(n) if _soil_dynamic_batch else 1
+    interpreter = acquire_soil_interpreter(size)
+    if interpreter is None:
+        for _, future in batch:
+            future.set_result(None)
+        return
+
+    try:
+        # Reuse this executor thread's batch buffer instead of allocating per batch
+        buf = getattr(_soil_buffers, "batch", None)
+        if buf is None:
+            buf = _soil_buffers.batch = np.empty((SOIL_BATCH_MAX, SOIL_IMG_SIZE, SOIL_IMG_SIZE, 3), dtype=np.float32)
+        images = np.stack([img for img, _ in batch], out=buf[:n])
+        preds = None
+        if _soil_dynamic_batch or n == 1:
+            try:
+                # Padding rows are zeros and their predictions are dropped
+                buf[n:size] = 0
+                preds = _soil_invoke(interpreter, buf[:size])[:n]
+            except Exception as e:
+                if n == 1:
+                    raise
+                # Model may not accept a dynamic batch dimension; score one by one from now on
+                print(f"Soil batch invoke failed ({n} images), scoring singly from now on: {e}")
+                _soil_dynamic_batch = False
+        if preds is None:
+            preds = np.concatenate([_soil_invoke(interpreter, images[i:i + 1]) for i in range(len(images))])
+
+        for (_, future), row in zip(batch, preds):
+            future.set_result(row)
+    except Exception as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+    finally:
+        release_soil_interpreter(interpreter)
+
+def _predict_soil_probs(img_array):
+    """Class probabilities for one preprocessed image, or None."""
+    if SOIL_BATCH_MAX <= 1:
+        interpreter = acquire_soil_interpreter()
+        if interpreter is None:
+            return None
+        try:
+            return _soil_invoke(interpreter, img_array[np.newaxis])[0]
+        finally:
+            release_soil_interpreter(interpreter)
+
+    _start_soil_dispatcher()
+    future = Future()
+    # img_array is this thread's reusable buffer; the batch gets its own copy
+    # so a later request on this thread can't overwrite a queued image
+    _soil_queue.put((img_array.copy(), future))
+    try:
+        return future.result(timeout=SOIL_POOL_TIMEOUT + 30)
+    except FuturesTimeout:
+        future.cancel()   # dropped by _run_soil_batch if not started yet
+        raise
+
+def preprocess_soil_image(image_bytes, timings=None):
+    """
+    Decodes, resizes and normalises a soil photo (bytes or a seekable binary
+    file) into this thread's reusable (150, 150, 3) float32 buffer. The
+    returned array is overwritten by the next call on the same thread.
+    Raises ImageTooLarge for payloads over SOIL_MAX_IMAGE_BYTES / SOIL_MAX_PIXELS.
+    """
+    if isinstance(image_bytes, (bytes, bytearray, memoryview)):
+        size = len(image_bytes)
+        fp = io.BytesIO(image_bytes)
+    else:
+        # Seekable binary file (e.g. an upload spooled by werkzeug): read in place
+        fp = image_bytes
+        fp.seek(0, os.SEEK_END)
+        size = fp.tell()
+        fp.seek(0)
+    if size > SOIL_MAX_IMAGE_BYTES:
+        raise ImageTooLarge(f"Image too large ({size} bytes, max {SOIL_MAX_IMAGE_BYTES})")
+
+    t0 = time.perf_counter()
+    try:
+        img = Image.open(fp)  # reads the header only
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    width, height = img.size
+    if width * height > SOIL_MAX_PIXELS:
+        raise ImageTooLarge(f"Image too large ({width}x{height}, max {SOIL_MAX_PIXELS} pixels)")
+    if img.format == "JPEG":
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale, keeping >= 2x the model input
+        img.draft("RGB", (SOIL_IMG_SIZE * 2, SOIL_IMG_SIZE * 2))
+    img = img.convert("RGB")
+    t1 = time.perf_counter()
+
+    img = img.resize((SOIL_IMG_SIZE, SOIL_IMG_SIZE))
+    buf = getattr(_soil_buffers, "image", None)
+    if buf is None:
+        buf = _soil_buffers.image = np.empty((SOIL_IMG_SIZE, SOIL_IMG_SIZE, 3), dtype=np.float32)
+    np.divide(np.asarray(img), np.float32(255.0), out=buf)
+    t2 = time.perf_counter()
+
+    if timings is not None:
+        timings["decode_ms"] = (t1 - t0) * 1000
+        timings["resize_ms"] = (t2 - t1) * 1000
+    return buf
+
+def predict_soil_from_image(image_bytes, timings=None):
+    """
+    Predicts soil type from image bytes (or a seekable binary file).
+    Pass a dict as `timings` to receive decode_ms, resize_ms and inference_ms.
+    Raises ImageTooLarge; any other failure gives ("Unknown", 0.0).
+    """
+    try:
+        img_array = preprocess_soil_image(image_bytes, timings)
+
+        # Predict using TFLite (possibly batched with other requests)
+        t0 = time.perf_counter()
+        preds = _predict_soil_probs(img_array)
+        if timings is not None:
+            timings["inference_ms"] = (time.perf_counter() - t0) * 1000
+        if preds is None:
+            return "Unknown", 0.0
+
         class_idx = np.argmax(preds)
         confidence = float(np.max(preds))
         soil_type = soil_classes.get(str(class_idx), "Unknown") # JSON keys are strings
@@ -105,13 +380,11 @@ def predict_soil_from_image(image_bytes):
             soil_type = soil_classes.get(class_idx, "Unknown")
             
         return soil_type, confidence
+    except ImageTooLarge:
+        raise
     except Exception as e:
         print(f"Error in soil prediction: {e}")
         return "Unknown", 0.0
-    finally:
-        # Aggressively clear model to free memory
-        soil_model = None
-        gc.collect()
 
 def get_npk_for_soil(soil_type):
     """
@@ -124,6 +397,127 @@ def get_npk_for_soil(soil_type):
     # Defaults
     return 40, 40, 40
 
+# Column order the crop model was trained on
+CROP_FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+def sklearn_predict_proba(values):
+    """Single-row class probabilities through sklearn (the reference path)."""
+    # Input DataFrame with feature names to avoid warnings
+    input_data = pd.DataFrame([values], columns=CROP_FEATURES)
+    return crop_model.predict_proba(input_data)[0]
+
+def compile_crop_forest(model):
+    """
+    Flattens a fitted RandomForestClassifier into plain NumPy arrays so a single
+    row can be scored without pandas or sklearn's per-call validation.
+    All trees share one node table; leaves point to themselves so every tree can
+    be walked in lock-step for `depth` steps. Raises if the compiled form does
+    not reproduce sklearn's probabilities bit-for-bit.
+    """
+    trees = [est.tree_ for est in model.estimators_]
+    n_classes = int(model.n_classes_)
+    if model.n_outputs_ != 1:
+        raise ValueError("multi-output forests are not supported")
+
+    # sklearn >= 1.4 stores leaf fractions in tree_.value; older versions
+    # normalise the counts inside predict_proba. Mirror whichever is in use.
+    probe = np.zeros((1, len(CROP_FEATURES)), dtype=np.float32)
+    first = model.estimators_[0]
+    raw = trees[0].value[first.apply(probe)[0], 0, :n_classes]
+    normalise = not np.array_equal(first.predict_proba(probe)[0], raw)
+
+    feature, threshold, left, right, leaf_slot, leaf_rows, roots = [], [], [], [], [], [], []
+    offset = 0
+    n_leaves = 0
+    for t in trees:
+        ids = np.arange(t.node_count, dtype=np.intp) + offset
+        is_leaf = t.children_left == -1
+
+        feature.append(np.where(is_leaf, 0, t.feature).astype(np.intp))
+        threshold.append(np.where(is_leaf, np.inf, t.threshold))
+        left.append(np.where(is_leaf, ids, t.children_left + offset).astype(np.intp))
+        right.append(np.where(is_leaf, ids, t.children_right + offset).astype(np.intp))
+
+        proba = t.value[is_leaf, 0, :n_classes].astype(np.float64)
+        if normalise:
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+        leaf_rows.append(proba)
+
+        slot = np.full(t.node_count, -1, dtype=np.intp)
+        slot[is_leaf] = np.arange(n_leaves, n_leaves + is_leaf.sum())
+        leaf_slot.append(slot)
+
+        roots.append(offset)
+        n_leaves += int(is_leaf.sum())
+        offset += t.node_count
+
+    forest = {
+        "feature": np.concatenate(feature),
+        "threshold": np.concatenate(threshold),
+        "left": np.concatenate(left),
+        "right": np.concatenate(right),
+        "leaf_slot": np.concatenate(leaf_slot),
+        "leaf_proba": np.concatenate(leaf_rows),
+        "roots": np.array(roots, dtype=np.intp),
+        "depth": max(t.max_depth for t in trees),
+        "n_trees": len(trees),
+    }
+
+    # Self-check against sklearn on a spread of inputs before trusting it
+    rng = np.random.default_rng(0)
+    checks = rng.uniform([0, 0, 0, 5, 10, 3, 20], [140, 145, 205, 45, 100, 10, 300], size=(32, 7))
+    expected = model.predict_proba(pd.DataFrame(checks, columns=CROP_FEATURES))
+    for row, want in zip(checks, expected):
+        if not np.array_equal(forest_predict_proba(forest, row), want):
+            raise ValueError("compiled forest does not match sklearn output")
+    return forest
+
+def forest_predict_proba(forest, values):
+    """Class probabilities for one row using a forest from compile_crop_forest()."""
+    # Trees compare float32 features against float64 thresholds, like sklearn
+    x = np.asarray(values, dtype=np.float32)
+    feature, threshold = forest["feature"], forest["threshold"]
+    left, right = forest["left"], forest["right"]
+
+    node = forest["roots"]
+    for _ in range(forest["depth"]):
+        node = np.where(x[feature[node]] <= threshold[node], left[node], right[node])
+
+    leaves = forest["leaf_proba"][forest["leaf_slot"][node]]
+    # Reducing over the outer axis adds row after row in estimator order, the
+    # same sequence RandomForest uses (compile_crop_forest() verifies this)
+    probs = leaves.sum(axis=0)
+    probs /= forest["n_trees"]
+    return probs
+
+def top_k_indices(probs, k):
+    """
+    Column indices of the k highest probabilities in each row of `probs`, best
+    first, in exactly the order predict_crop() gives for that row.
+    argpartition picks the candidates; rows whose top k+1 values are distinct
+    have a unique order by value. Rows with a tie there fall back to
+    predict_crop()'s own argsort, so tied classes come out the same way.
+    """
+    n_classes = probs.shape[1]
+    if k >= n_classes:
+        top_idx = np.argsort(probs, axis=1)[:, ::-1]
+        tied = np.ones(len(probs), dtype=bool)
+    else:
+        # Top k+1 candidates: a tie anywhere among them can change which classes
+        # (or in which order) make the top k
+        cand = np.argpartition(probs, n_classes - k - 1, axis=1)[:, n_classes - k - 1:]
+        cand_probs = np.take_along_axis(probs, cand, axis=1)
+        order = np.argsort(-cand_probs, axis=1)
+        cand = np.take_along_axis(cand, order, axis=1)
+        cand_probs = np.take_along_axis(cand_probs, order, axis=1)
+        top_idx = cand[:, :k]
+        tied = (np.diff(cand_probs, axis=1) == 0).any(axis=1)
+    for row in np.flatnonzero(tied):
+        top_idx[row] = np.argsort(probs[row])[-k:][::-1]
+    return top_idx
+
 def predict_crop(n, p, k, temp, humid, ph, rain):
     """
     Predicts crop based on inputs.
@@ -131,12 +525,11 @@ def predict_crop(n, p, k, temp, humid, ph, rain):
     if crop_model is None:
         return "Model Not Loaded"
 
-    # Input DataFrame with feature names to avoid warnings
-    features = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
-    input_data = pd.DataFrame([[n, p, k, temp, humid, ph, rain]], columns=features)
-    
     # Get probabilities
-    probs = crop_model.predict_proba(input_data)[0]
+    if crop_forest is not None:
+        probs = forest_predict_proba(crop_forest, [n, p, k, temp, humid, ph, rain])
+    else:
+        probs = sklearn_predict_proba([n, p, k, temp, humid, ph, rain])
     classes = crop_model.classes_
 
     # Get Top 3
@@ -150,5 +543,43 @@ def predict_crop(n, p, k, temp, humid, ph, rain):
     
     return top_3_crops
 
+def predict_crop_batch(rows, top_k=3):
+    """
+    Predicts the top-k crops for many rows with a single predict_proba call.
+    rows: (N x 7) array-like in CROP_FEATURES order, or a DataFrame with those columns.
+    Returns one list of {"crop", "confidence"} per row, best first.
+    """
+    if crop_model is None:
+        return "Model Not Loaded"
+
+    if isinstance(rows, pd.DataFrame):
+        missing = [c for c in CROP_FEATURES if c not in rows.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        input_data = rows[CROP_FEATURES].astype(np.float64)
+    else:
+        arr = np.asarray(rows, dtype=np.float64)
+        if arr.size == 0:
+            return []
+        if arr.ndim != 2 or arr.shape[1] != len(CROP_FEATURES):
+            raise ValueError(f"Expected an (N, {len(CROP_FEATURES)}) array, got shape {arr.shape}")
+        input_data = pd.DataFrame(arr, columns=CROP_FEATURES)
+
+    if len(input_data) == 0:
+        return []
+
+    probs = crop_model.predict_proba(input_data)
+    classes = crop_model.classes_
+    k = max(1, min(int(top_k), probs.shape[1]))
+
+    top_idx = top_k_indices(probs, k)
+    top_probs = np.take_along_axis(probs, top_idx, axis=1)
+
+    top_names = classes[top_idx]
+    return [
+        [{"crop": str(name), "confidence": float(conf)} for name, conf in zip(names_row, probs_row)]
+        for names_row, probs_row in zip(top_names, top_probs)
+    ]
+
 # Load on module import or explicit call
 load_resources()
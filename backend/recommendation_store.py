@@ -0,0 +1,278 @@
+"""
+recommendation_store.py — Compact storage for Recommendations rows
+Rows are written in a normalized form: Gemini explanation text is stored once
+in ExplanationTexts (keyed by its SHA-256), recommended_crops holds a compact
+array per crop, and full_response is left NULL and rebuilt on read from the
+row's columns plus `details`. Rows in the old layout (full_response set) are
+still read as-is until they are backfilled.
+
+Compact layouts:
+    hybrid  recommended_crops [[crop, confidence, text_hash], ...]
+            details {"kind": "hybrid", "soil_confidence", "npk": [N, P, K], "language"}
+    kore    recommended_crops [[crop, confidence_pct, suitability], ...]
+            details {"kind": "kore"}
+
+Offline usage:
+    python recommendation_store.py backfill [--batch N]   # convert old rows, report sizes
+    python recommendation_store.py report                 # table sizes only
+"""
+
+import os
+import sys
+import json
+import hashlib
+
+from psycopg2.extras import RealDictCursor, execute_values
+
+import db
+import write_behind
+from knowledge_base import RISK_TEMPLATES
+
+# "compact" (default) or "full" to keep writing the old duplicated layout
+RECOMMENDATION_STORAGE = os.getenv("RECOMMENDATION_STORAGE", "compact")
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def risks_precautions(language, humidity):
+    # Fallback to English if lang not found
+    rt = RISK_TEMPLATES.get(language, RISK_TEMPLATES["en"])
+    return {
+        "risks": [rt["high_humidity"] if humidity > 80 else rt["normal"]],
+        "precautions": [rt["drainage"], rt["organic"]]
+    }
+
+def build_result(soil_type, soil_conf, npk, weather, recommendations, language):
+    """The /recommend_hybrid response body (also what full_response holds)."""
+    n, p, k = npk
+    return {
+        "soil_assessment": {
+            "type": soil_type,
+            "confidence": float(soil_conf),
+            "inferred_npk": {"N": n, "P": p, "K": k},
+            "moisture": "High" if weather['rainfall'] > 100 else "Medium",
+            "fertility": "High" if n > 50 else "Medium"
+        },
+        "weather_summary": {
+            "temperature": weather['temperature'],
+            "rainfall": weather['rainfall'],
+            "humidity": weather['humidity'],
+            "season": "Kharif"
+        },
+        "recommended_crops": recommendations,
+        "risks_precautions": risks_precautions(language, weather['humidity']),
+        "timestamp": "Just Now"
+    }
+
+# --- Compaction ---
+
+def compact_hybrid(recommendations, soil_conf, npk, language):
+    """-> (compact crops, details, {hash: text})"""
+    crops, texts = [], {}
+    for rec in recommendations:
+        explanation = rec.get("explanation") or {}
+        text = explanation.get("text", "")
+        h = text_hash(text)
+        texts[h] = text
+        entry = [rec["crop"], rec["confidence"], h]
+        if explanation.get("bullet_points"):
+            entry.append(explanation["bullet_points"])
+        crops.append(entry)
+    details = {"kind": "hybrid", "soil_confidence": float(soil_conf), "npk": list(npk), "language": language}
+    return crops, details, texts
+
+def compact_kore(crops_out):
+    crops = [[c["crop"], c["confidence_pct"], c["suitability"]] for c in crops_out]
+    return crops, {"kind": "kore"}
+
+# --- Writes (through the write-behind queue) ---
+
+def record_hybrid(user_id, lat, lon, soil_type, weather, recommendations, result, soil_conf, npk, language):
+    if RECOMMENDATION_STORAGE == "full":
+        row = (user_id, lat, lon, soil_type, json.dumps(weather), json.dumps(recommendations), None, json.dumps(result))
+    else:
+        crops, details, texts = compact_hybrid(recommendations, soil_conf, npk, language)
+        write_behind.enqueue("ExplanationTexts", list(texts.items()))
+        row = (user_id, lat, lon, soil_type, json.dumps(weather), json.dumps(crops), json.dumps(details), None)
+    write_behind.enqueue("Recommendations", [row])
+
+def record_kore(user_id, lat, lon, soil_type, weather, crops_out):
+    if RECOMMENDATION_STORAGE == "full":
+        row = (user_id, lat, lon, soil_type, json.dumps(weather), json.dumps(crops_out), None, json.dumps(crops_out))
+    else:
+        crops, details = compact_kore(crops_out)
+        row = (user_id, lat, lon, soil_type, json.dumps(weather), json.dumps(crops), json.dumps(details), None)
+    write_behind.enqueue("Recommendations", [row])
+
+# --- Reads ---
+
+def _expand_hybrid(row, texts):
+    details = row['details']
+    recommendations = []
+    for entry in row['recommended_crops']:
+        crop, confidence, h = entry[:3]
+        recommendations.append({
+            "crop": crop,
+            "confidence": confidence,
+            "suitability": "High" if confidence > 0.7 else "Medium",
+            "explanation": {"text": texts.get(h, ""), "bullet_points": entry[3] if len(entry) > 3 else []}
+        })
+    result = build_result(row['soil_type'], details['soil_confidence'], details['npk'],
+                          row['weather_json'], recommendations, details['language'])
+    return recommendations, result
+
+def _expand_kore(row):
+    crops = [{"crop": c, "confidence_pct": pct, "suitability": s} for c, pct, s in row['recommended_crops']]
+    return crops, crops
+
+def expand(conn, rows):
+    """
+    Fill in recommended_crops / full_response of compact rows in place.
+    `rows` are dicts with recommended_crops, soil_type, weather_json, details
+    and full_response. Explanation texts are fetched in one query.
+    """
+    hashes = {entry[2] for row in rows if (row.get('details') or {}).get('kind') == 'hybrid'
+              for entry in row['recommended_crops']}
+    texts = {}
+    if hashes:
+        cur = conn.cursor()
+        cur.execute("SELECT hash, text FROM ExplanationTexts WHERE hash = ANY(%s)", (list(hashes),))
+        texts = dict(cur.fetchall())
+        cur.close()
+    for row in rows:
+        kind = (row.get('details') or {}).get('kind')
+        if row.get('full_response') is not None or kind is None:
+            continue
+        if kind == 'hybrid':
+            row['recommended_crops'], row['full_response'] = _expand_hybrid(row, texts)
+        elif kind == 'kore':
+            row['recommended_crops'], row['full_response'] = _expand_kore(row)
+    return rows
+
+# --- Backfill ---
+
+def _compact_legacy(row):
+    """
+    Compact form of an old-layout row, or None if it doesn't rebuild to
+    exactly the stored full_response (those rows are left untouched).
+    -> (crops, details, texts)
+    """
+    full = row['full_response']
+    if isinstance(full, list):
+        try:
+            crops, details = compact_kore(full)
+        except (KeyError, TypeError):
+            return None
+        rebuilt, _ = _expand_kore({**row, 'recommended_crops': crops})
+        return (crops, details, {}) if rebuilt == full == row['recommended_crops'] else None
+
+    if not isinstance(full, dict) or not isinstance(row['weather_json'], dict):
+        return None
+    try:
+        recommendations = full['recommended_crops']
+        soil = full['soil_assessment']
+        npk = [soil['inferred_npk'][key] for key in ('N', 'P', 'K')]
+        # The language isn't stored on old rows; it is whichever renders the same risks
+        for language in RISK_TEMPLATES:
+            crops, details, texts = compact_hybrid(recommendations, soil['confidence'], npk, language)
+            candidate = {**row, 'recommended_crops': crops, 'details': details, 'full_response': None}
+            rebuilt_crops, rebuilt = _expand_hybrid(candidate, texts)
+            if rebuilt == full and rebuilt_crops == row['recommended_crops']:
+                return crops, details, texts
+    except (KeyError, TypeError, ValueError, IndexError):
+        pass
+    return None
+
+def size_report(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT (SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0) FROM pg_partition_tree('recommendations')),
+               COALESCE((SELECT SUM(pg_column_size(r.*)) FROM Recommendations r), 0),
+               pg_total_relation_size('explanationtexts'),
+               COALESCE((SELECT SUM(pg_column_size(t.*)) FROM ExplanationTexts t), 0),
+               (SELECT COUNT(*) FROM Recommendations WHERE full_response IS NOT NULL),
+               (SELECT COUNT(*) FROM Recommendations WHERE full_response IS NULL)
+    """)
+    keys = ("recommendations_disk", "recommendations_rows", "texts_disk", "texts_rows", "old_layout", "compact")
+    report = dict(zip(keys, (int(v) for v in cur.fetchone())))
+    cur.close()
+    return report
+
+def _print_report(label, report):
+    mb = lambda b: f"{b / 1048576:.2f} MB" if b >= 1048576 else f"{b / 1024:.1f} KB"
+    print(f"{label}: Recommendations {mb(report['recommendations_disk'])} on disk / "
+          f"{mb(report['recommendations_rows'])} live rows; ExplanationTexts {mb(report['texts_disk'])} on disk / "
+          f"{mb(report['texts_rows'])} live rows; {report['old_layout']} old-layout, {report['compact']} compact")
+
+def backfill(batch_size=500):
+    """Convert old-layout rows in id order, one transaction per batch."""
+    with db.connection() as conn:
+        if not conn:
+            raise RuntimeError("Database unavailable")
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        before = size_report(conn)
+        _print_report("Before", before)
+
+        last_id, converted, kept = 0, 0, 0
+        while True:
+            cur.execute("""
+                SELECT id, recommended_crops, soil_type, weather_json, full_response
+                FROM Recommendations
+                WHERE full_response IS NOT NULL AND id > %s
+                ORDER BY id LIMIT %s
+            """, (last_id, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+
+            updates, texts = [], {}
+            for row in rows:
+                compacted = _compact_legacy(row)
+                if compacted is None:
+                    kept += 1
+                    continue
+                crops, details, row_texts = compacted
+                texts.update(row_texts)
+                updates.append((row['id'], json.dumps(crops), json.dumps(details)))
+
+            if texts:
+                execute_values(cur, "INSERT INTO ExplanationTexts (hash, text) VALUES %s ON CONFLICT (hash) DO NOTHING",
+                               list(texts.items()))
+            if updates:
+                execute_values(cur, """
+                    UPDATE Recommendations r SET
+                        recommended_crops = v.crops::jsonb,
+                        details = v.details::jsonb,
+                        full_response = NULL
+                    FROM (VALUES %s) AS v(id, crops, details)
+                    WHERE r.id = v.id
+                """, updates)
+            conn.commit()
+            converted += len(updates)
+            print(f"  ... up to id {last_id}: {converted} converted, {kept} left as-is")
+
+        # Space held by the old row versions is only returned by VACUUM FULL
+        cur.execute("ANALYZE Recommendations")
+        conn.commit()
+        after = size_report(conn)
+        _print_report("After ", after)
+        saved = before['recommendations_rows'] + before['texts_rows'] - after['recommendations_rows'] - after['texts_rows']
+        print(f"Converted {converted} row(s), {kept} left in the old layout; live data shrank by {saved / 1024:.1f} KB.")
+        print("Run VACUUM FULL Recommendations in a quiet window to return the freed space to the OS.")
+        cur.close()
+        return {"converted": converted, "kept": kept, "before": before, "after": after}
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "backfill":
+        args = sys.argv[2:]
+        batch = int(args[args.index("--batch") + 1]) if "--batch" in args else 500
+        backfill(batch)
+    elif command == "report":
+        with db.connection() as conn:
+            if not conn:
+                sys.exit("Database unavailable")
+            _print_report("Current", size_report(conn))
+    else:
+        print(__doc__)
@@ -0,0 +1,226 @@
+"""
+schedule_templates.py — Cultivation schedule templates keyed by crop
+Schedules are stored once per normalised crop name in
+models/schedule_templates.json, so starting a cultivation is a local lookup.
+Gemini is only asked on a miss; its answer is validated before being stored,
+and only for known crops. Every process re-reads the file when it changes and
+merges its writes into the current contents (under a file lock), so the
+invalidate command takes effect on running servers.
+
+Offline usage:
+    python schedule_templates.py precompute [--force]   # seed all dataset crops
+    python schedule_templates.py invalidate [crop ...]  # drop one, some or all
+"""
+
+import os
+import re
+import sys
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+import chatbot_engine
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_PATH = os.getenv("SCHEDULE_TEMPLATES_PATH", os.path.join(BASE_DIR, "models", "schedule_templates.json"))
+CROP_CSV = os.path.join(BASE_DIR, "datasets", "Crop_recommendation.csv")
+
+# Limits for a usable schedule (Schedules.task_name is VARCHAR(255))
+MAX_TASKS = 20
+MAX_DAYS = 730
+
+_templates = {}
+_templates_stamp = None   # (mtime_ns, size) of the file _templates was read from
+_lock = threading.Lock()
+_inflight = {}            # key -> [Lock, users]: one Gemini call per crop at a time
+_known = None
+
+def normalize_crop(crop_name):
+    """'Kidney Beans ' -> 'kidneybeans' (matches the dataset labels)."""
+    return re.sub(r"[^a-z]", "", str(crop_name).lower())
+
+def validate_schedule(tasks):
+    """
+    Cleaned, chronologically sorted copy of a generated schedule,
+    or None if it isn't usable.
+    """
+    if not isinstance(tasks, list) or not tasks:
+        return None
+    cleaned = []
+    for t in tasks[:MAX_TASKS]:
+        if not isinstance(t, dict):
+            return None
+        name = str(t.get('task_name', '')).strip()
+        try:
+            days = int(t.get('days_from_start', 0))
+        except (TypeError, ValueError):
+            return None
+        if not name or not 0 <= days <= MAX_DAYS:
+            return None
+        cleaned.append({"task_name": name[:255], "days_from_start": days})
+    cleaned.sort(key=lambda t: t['days_from_start'])
+    return cleaned
+
+def _stamp():
+    try:
+        st = os.stat(TEMPLATES_PATH)
+        return (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+def _read():
+    try:
+        with open(TEMPLATES_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Failed to load schedule templates: {e}")
+        return {}
+
+def _load():
+    """Templates as on disk; re-read whenever another process (or the CLI) changed the file."""
+    global _templates, _templates_stamp
+    stamp = _stamp()
+    if stamp != _templates_stamp:
+        _templates, _templates_stamp = _read(), stamp
+    return _templates
+
+@contextmanager
+def _file_lock():
+    """Serialise read-modify-write of the templates file across processes."""
+    os.makedirs(os.path.dirname(TEMPLATES_PATH), exist_ok=True)
+    with open(TEMPLATES_PATH + ".lock", "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _update(change):
+    """
+    Apply change(templates) to the current file contents and write the result.
+    Re-reading under the file lock merges with other processes' edits instead
+    of overwriting them with this process's copy.
+    """
+    global _templates, _templates_stamp
+    with _lock, _file_lock():
+        templates = _read()
+        change(templates)
+        # Write-then-rename so a crash never leaves a half-written file
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(TEMPLATES_PATH),
+                                         prefix=".schedule_templates.", suffix=".tmp", delete=False) as f:
+            json.dump(templates, f, ensure_ascii=False, indent=2, sort_keys=True)
+        try:
+            os.replace(f.name, TEMPLATES_PATH)
+        except Exception:
+            os.remove(f.name)
+            raise
+        _templates, _templates_stamp = templates, _stamp()
+
+def known_crops():
+    """Normalised names that may be stored: the dataset labels and the knowledge base crops."""
+    global _known
+    if _known is None:
+        from knowledge_base import CROP_INFO
+        names = set(CROP_INFO) - {"default"}
+        try:
+            names.update(dataset_crops())
+        except Exception as e:
+            print(f"Failed to read dataset crops: {e}")
+        _known = {normalize_crop(n) for n in names}
+    return _known
+
+def get_schedule(crop_name, refresh=False):
+    """
+    Task list [{'task_name', 'days_from_start'}, ...] for a crop.
+    Served from the template store; Gemini is only consulted on a miss
+    (or with refresh=True), once per crop however many requests miss together.
+    Only known crops are stored; other names are generated every time.
+    Returns [] if no valid schedule can be produced.
+    """
+    key = normalize_crop(crop_name)
+    if not key:
+        return []
+
+    with _lock:
+        tasks = _load().get(key)
+    if tasks and not refresh:
+        return [dict(t) for t in tasks]
+
+    with _lock:
+        entry = _inflight.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            if not refresh:
+                # Another request may have generated it while this one waited
+                with _lock:
+                    tasks = _load().get(key)
+                if tasks:
+                    return [dict(t) for t in tasks]
+
+            tasks = validate_schedule(chatbot_engine.generate_cultivation_schedule(crop_name))
+            if not tasks:
+                return []
+            if key in known_crops():
+                try:
+                    _update(lambda templates: templates.__setitem__(key, tasks))
+                except Exception as e:
+                    print(f"Failed to save schedule template for {key}: {e}")
+            return [dict(t) for t in tasks]
+    finally:
+        with _lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _inflight.pop(key, None)
+
+def invalidate(crop_name=None):
+    """Forget one crop's template, or all of them when crop_name is None."""
+    if crop_name is None:
+        _update(lambda templates: templates.clear())
+    else:
+        key = normalize_crop(crop_name)
+        _update(lambda templates: templates.pop(key, None))
+
+def dataset_crops():
+    with open(CROP_CSV, "r", encoding="utf-8") as f:
+        header = f.readline().strip().split(",")
+        label_idx = header.index("label")
+        return sorted({line.strip().split(",")[label_idx] for line in f if line.strip()})
+
+def precompute(force=False):
+    crops = dataset_crops()
+    print(f"Precomputing schedules for {len(crops)} crops...")
+    for crop in crops:
+        with _lock:
+            cached = normalize_crop(crop) in _load()
+        if cached and not force:
+            print(f"  {crop}: cached")
+            continue
+        tasks = get_schedule(crop, refresh=True)
+        print(f"  {crop}: {len(tasks)} tasks" if tasks else f"  {crop}: FAILED (no valid schedule)")
+    print(f"Saved to {TEMPLATES_PATH}")
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "precompute":
+        precompute(force="--force" in sys.argv[2:])
+    elif command == "invalidate":
+        names = sys.argv[2:]
+        if not names:
+            invalidate()
+            print("All schedule templates removed.")
+        for name in names:
+            invalidate(name)
+            print(f"Removed schedule template for {normalize_crop(name)}.")
+    else:
+        print(__doc__)
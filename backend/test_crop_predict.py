@@ -0,0 +1,70 @@
+"""
+Crop top-3 must stay exactly what the original predict_crop() returned,
+including the order of tied classes, on both the compiled-forest fast path
+and the batch path:
+    cd backend && python -m pytest -q test_crop_predict.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ml_pipeline
+
+# predict_crop() output recorded from the original implementation; the second
+# row has a tie (grapes / lentil at 0.27)
+GOLDEN = [
+    ([20.1, 2.0, 47.1, 10.3, 71.0, 3.9, 161.8], [("pomegranate", 0.32), ("mango", 0.19), ("jute", 0.09)]),
+    ([40.1, 134.1, 5.1, 27.2, 67.1, 3.7, 59.3], [("grapes", 0.27), ("lentil", 0.27), ("mothbeans", 0.13)]),
+    ([83.1, 113.5, 163.0, 42.8, 32.8, 7.1, 46.6], [("grapes", 0.53), ("banana", 0.11), ("chickpea", 0.07)]),
+    ([82.6, 57.6, 56.3, 40.5, 26.9, 3.6, 115.7], [("coffee", 0.25), ("chickpea", 0.19), ("banana", 0.14)]),
+    ([38.2, 7.3, 121.9, 16.8, 69.7, 8.9, 25.1], [("muskmelon", 0.32), ("mothbeans", 0.17), ("chickpea", 0.15)]),
+]
+
+pytestmark = pytest.mark.skipif(ml_pipeline.crop_model is None, reason="crop model not available")
+
+
+def baseline_top3(values):
+    """The original predict_crop(): sklearn on a one-row DataFrame, then argsort."""
+    probs = ml_pipeline.crop_model.predict_proba(pd.DataFrame([values], columns=ml_pipeline.CROP_FEATURES))[0]
+    return [(str(ml_pipeline.crop_model.classes_[i]), float(probs[i])) for i in np.argsort(probs)[-3:][::-1]]
+
+
+def pairs(crops):
+    return [(str(c["crop"]), c["confidence"]) for c in crops]
+
+
+@pytest.fixture(scope="module")
+def rows():
+    # Rounded inputs give plenty of tied probabilities
+    rng = np.random.default_rng(42)
+    return np.round(rng.uniform([0, 0, 0, 5, 10, 3, 20], [140, 145, 205, 45, 100, 10, 300], size=(500, 7)), 1)
+
+
+@pytest.mark.parametrize("values,expected", GOLDEN)
+def test_golden_rows(values, expected):
+    assert pairs(ml_pipeline.predict_crop(*values)) == expected
+    assert pairs(ml_pipeline.predict_crop_batch([values])[0]) == expected
+
+
+def test_single_path_matches_baseline(rows):
+    assert ml_pipeline.crop_forest is not None
+    mismatches = [list(r) for r in rows if pairs(ml_pipeline.predict_crop(*r)) != baseline_top3(list(r))]
+    assert mismatches == []
+
+
+def test_batch_path_matches_baseline(rows):
+    batch = ml_pipeline.predict_crop_batch(rows)
+    mismatches = [list(r) for r, crops in zip(rows, batch) if pairs(crops) != baseline_top3(list(r))]
+    assert mismatches == []
+
+
+def test_top_k_indices_orders_ties_like_argsort():
+    probs = np.random.default_rng(0).integers(0, 4, size=(2000, 22)).astype(float)
+    for k in (1, 3, 5, 22):
+        expected = np.array([np.argsort(row)[-k:][::-1] for row in probs])
+        assert (ml_pipeline.top_k_indices(probs, k) == expected).all()
+
+
+def test_empty_batch():
+    assert ml_pipeline.predict_crop_batch(np.empty((0, 7))) == []
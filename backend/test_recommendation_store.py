@@ -0,0 +1,103 @@
+"""
+Compact Recommendations layout: what is written must read back as the exact
+response the client got. No database needed:
+    cd backend && python -m pytest -q test_recommendation_store.py
+"""
+
+import json
+
+import recommendation_store as store
+
+WEATHER = {"temperature": 29.4, "humidity": 86, "rainfall": 120.5, "location": "Guntur"}
+
+
+class FakeCursor:
+    """Answers expand()'s ExplanationTexts lookup from a dict."""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.rows = []
+
+    def execute(self, sql, params):
+        assert "ExplanationTexts" in sql
+        self.rows = [(h, self.texts[h]) for h in params[0] if h in self.texts]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, texts):
+        self.texts = texts
+
+    def cursor(self):
+        return FakeCursor(self.texts)
+
+
+def hybrid_recommendations():
+    return [
+        {"crop": "rice", "confidence": 0.81, "suitability": "High",
+         "explanation": {"text": "Rice suits the high rainfall.", "bullet_points": ["Rain", "Clay soil"]}},
+        {"crop": "jute", "confidence": 0.12, "suitability": "Medium",
+         "explanation": {"text": "Jute tolerates humidity.", "bullet_points": []}},
+        # Same explanation text as another row: stored once
+        {"crop": "maize", "confidence": 0.07, "suitability": "Medium",
+         "explanation": {"text": "Rice suits the high rainfall.", "bullet_points": []}},
+    ]
+
+
+def stored(crops, details, soil_type="Clay"):
+    """A row as psycopg2 returns it from the jsonb columns."""
+    return {"soil_type": soil_type, "weather_json": json.loads(json.dumps(WEATHER)),
+            "recommended_crops": json.loads(json.dumps(crops)),
+            "details": json.loads(json.dumps(details)), "full_response": None}
+
+
+def test_hybrid_round_trip():
+    recommendations = hybrid_recommendations()
+    result = store.build_result("Clay", 0.93, (90, 42, 43), WEATHER, recommendations, "hi")
+    crops, details, texts = store.compact_hybrid(recommendations, 0.93, (90, 42, 43), "hi")
+    assert len(texts) == 2
+
+    row = stored(crops, details)
+    store.expand(FakeConn(texts), [row])
+    assert row["recommended_crops"] == recommendations
+    assert row["full_response"] == json.loads(json.dumps(result))
+
+
+def test_kore_round_trip():
+    crops_out = [{"crop": "cotton", "confidence_pct": 64.0, "suitability": "Medium"},
+                 {"crop": "maize", "confidence_pct": 21.5, "suitability": "Medium"}]
+    crops, details = store.compact_kore(crops_out)
+
+    row = stored(crops, details, soil_type="Black")
+    store.expand(FakeConn({}), [row])
+    assert row["recommended_crops"] == crops_out
+    assert row["full_response"] == crops_out
+
+
+def test_old_layout_rows_are_left_alone():
+    full = {"recommended_crops": [], "note": "written by an older version"}
+    row = {"soil_type": "Clay", "weather_json": WEATHER, "recommended_crops": [],
+           "details": None, "full_response": full}
+    store.expand(FakeConn({}), [row])
+    assert row["full_response"] is full
+
+
+def test_backfill_compacts_only_rows_that_rebuild_exactly():
+    recommendations = hybrid_recommendations()
+    result = store.build_result("Clay", 0.93, (90, 42, 43), WEATHER, recommendations, "te")
+    legacy = {"soil_type": "Clay", "weather_json": WEATHER,
+              "recommended_crops": recommendations, "full_response": result}
+
+    crops, details, texts = store._compact_legacy(legacy)
+    assert details["language"] == "te"
+    row = stored(crops, details)
+    store.expand(FakeConn(texts), [row])
+    assert row["full_response"] == result
+
+    edited = dict(result, timestamp="2024-06-01")
+    assert store._compact_legacy(dict(legacy, full_response=edited)) is None
@@ -0,0 +1,128 @@
+"""
+Soil micro-batching with a stand-in interpreter (no TFLite needed): every
+caller gets its own image's prediction, and batches are padded to a few
+bucketed sizes so the interpreter input is rarely reallocated:
+    cd backend && python -m pytest -q test_soil_batching.py
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+import ml_pipeline
+
+SIZE = ml_pipeline.SOIL_IMG_SIZE
+
+
+class FakeInterpreter:
+    """Predicts each image's first pixel; records input reallocations."""
+
+    def __init__(self):
+        self.shape = (1, SIZE, SIZE, 3)
+        self.resizes = []
+        self.invoked = []
+
+    def get_input_details(self):
+        return [{"index": 0, "shape": np.array(self.shape)}]
+
+    def get_output_details(self):
+        return [{"index": 1}]
+
+    def resize_tensor_input(self, index, shape):
+        self.shape = tuple(shape)
+        self.resizes.append(self.shape[0])
+
+    def allocate_tensors(self):
+        pass
+
+    def set_tensor(self, index, value):
+        assert value.shape == self.shape
+        self.input = np.array(value)
+
+    def invoke(self):
+        self.invoked.append(self.shape[0])
+
+    def get_tensor(self, index):
+        return self.input[:, 0, 0, :]
+
+
+@pytest.fixture
+def interpreters(monkeypatch):
+    created = []
+
+    def create():
+        created.append(FakeInterpreter())
+        return created[-1]
+
+    monkeypatch.setattr(ml_pipeline, "_create_soil_interpreter", create)
+    monkeypatch.setattr(ml_pipeline, "_start_soil_evictor", lambda: None)
+    monkeypatch.setattr(ml_pipeline, "_soil_dynamic_batch", True)
+    monkeypatch.setattr(ml_pipeline, "_soil_idle", [])
+    monkeypatch.setattr(ml_pipeline, "_soil_created", 0)
+    return created
+
+
+def image(value):
+    return np.full((SIZE, SIZE, 3), value, dtype=np.float32)
+
+
+def run_batch(values):
+    batch = [(image(v), ml_pipeline.Future()) for v in values]
+    ml_pipeline._run_soil_batch(batch)
+    return [future.result(timeout=1) for _, future in batch]
+
+
+def test_bucket_sizes(monkeypatch):
+    monkeypatch.setattr(ml_pipeline, "SOIL_BATCH_MAX", 8)
+    assert [ml_pipeline._soil_batch_bucket(n) for n in range(1, 9)] == [1, 2, 4, 4, 8, 8, 8, 8]
+    monkeypatch.setattr(ml_pipeline, "SOIL_BATCH_MAX", 6)
+    assert [ml_pipeline._soil_batch_bucket(n) for n in range(1, 7)] == [1, 2, 4, 4, 6, 6]
+
+
+def test_padded_batches_return_each_callers_row(interpreters, monkeypatch):
+    monkeypatch.setattr(ml_pipeline, "SOIL_POOL_SIZE", 1)
+    monkeypatch.setattr(ml_pipeline, "SOIL_BATCH_MAX", 8)
+    for values in ([0.1, 0.2, 0.3], [0.4], [0.5, 0.6, 0.7, 0.8, 0.9]):
+        preds = run_batch(values)
+        assert [round(float(p[0]), 5) for p in preds] == values
+    assert interpreters[0].invoked == [4, 1, 8]
+
+
+def test_same_bucket_does_not_reallocate(interpreters, monkeypatch):
+    monkeypatch.setattr(ml_pipeline, "SOIL_POOL_SIZE", 1)
+    monkeypatch.setattr(ml_pipeline, "SOIL_BATCH_MAX", 8)
+    for n in (3, 4, 3, 3, 4):
+        run_batch([0.5] * n)
+    assert interpreters[0].resizes == [4]
+
+
+def test_idle_interpreter_with_matching_shape_is_preferred(interpreters, monkeypatch):
+    monkeypatch.setattr(ml_pipeline, "SOIL_POOL_SIZE", 2)
+    monkeypatch.setattr(ml_pipeline, "SOIL_BATCH_MAX", 8)
+    singles = ml_pipeline.acquire_soil_interpreter(1)
+    batches = ml_pipeline.acquire_soil_interpreter(4)
+    ml_pipeline._soil_invoke(batches, np.zeros((4, SIZE, SIZE, 3), dtype=np.float32))
+    ml_pipeline.release_soil_interpreter(batches)
+    ml_pipeline.release_soil_interpreter(singles)
+
+    for n in (4, 1, 3, 1, 4, 2, 1):
+        run_batch([0.5] * n)
+    # Past the set-up resize to 4, only the batch of 2 needed a new shape
+    assert sorted(i.resizes for i in interpreters) == [[], [4, 2]]
+
+
+def test_concurrent_callers_get_their_own_prediction(interpreters, monkeypatch):
+    monkeypatch.setattr(ml_pipeline, "SOIL_POOL_SIZE", 1)
+    results = {}
+
+    def predict(v):
+        results[v] = float(ml_pipeline._predict_soil_probs(image(v))[0])
+
+    threads = [threading.Thread(target=predict, args=(v / 10,)) for v in range(1, 10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert {v: round(p, 5) for v, p in results.items()} == {v / 10: v / 10 for v in range(1, 10)}
+    assert set(interpreters[0].invoked) <= {1, 2, 4, 8}
@@ -0,0 +1,39 @@
+"""
+Soil photo size limits surface as ImageTooLarge (413 in /recommend_hybrid)
+rather than as an unrecognised-soil result:
+    cd backend && python -m pytest -q test_soil_image.py
+"""
+
+import io
+
+import pytest
+from PIL import Image
+
+import ml_pipeline
+
+
+def png(width, height):
+    buf = io.BytesIO()
+    Image.new("L", (width, height)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_small_photo_is_preprocessed():
+    out = ml_pipeline.preprocess_soil_image(png(300, 200))
+    assert out.shape == (ml_pipeline.SOIL_IMG_SIZE, ml_pipeline.SOIL_IMG_SIZE, 3)
+
+
+def test_too_many_bytes(monkeypatch):
+    monkeypatch.setattr(ml_pipeline, "SOIL_MAX_IMAGE_BYTES", 100)
+    with pytest.raises(ml_pipeline.ImageTooLarge):
+        ml_pipeline.predict_soil_from_image(png(300, 200))
+
+
+def test_too_many_pixels(monkeypatch):
+    monkeypatch.setattr(ml_pipeline, "SOIL_MAX_PIXELS", 300 * 200 - 1)
+    with pytest.raises(ml_pipeline.ImageTooLarge):
+        ml_pipeline.predict_soil_from_image(io.BytesIO(png(300, 200)))
+
+
+def test_undecodable_photo_is_unknown_soil():
+    assert ml_pipeline.predict_soil_from_image(b"not an image") == ("Unknown", 0.0)
@@ -0,0 +1,146 @@
+"""
+Weather cache / circuit breaker checks against a local OpenWeatherMap stub.
+No network or API key needed:
+    cd backend && python -m pytest -q test_weather_service.py
+"""
+
+import json
+import threading
+import http.server
+
+import pytest
+
+import weather_service
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    calls = []
+    status = 200
+    delay = 0.0
+    release = None   # threading.Event the handler waits on, if set
+
+    def do_GET(self):
+        StubHandler.calls.append(self.path)
+        if StubHandler.release is not None:
+            StubHandler.release.wait(5)
+        body = json.dumps({"main": {"temp": 25.5, "humidity": 61}, "name": "Stubville"}).encode()
+        self.send_response(StubHandler.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/data/2.5/weather"
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(stub_url, monkeypatch):
+    monkeypatch.setattr(weather_service, "OPENWEATHER_URL", stub_url)
+    monkeypatch.setattr(weather_service, "WEATHER_RETRY_BACKOFF", 0.0)
+    StubHandler.calls.clear()
+    StubHandler.status = 200
+    StubHandler.release = None
+    weather_service.clear_cache()
+    with weather_service._breaker_lock:
+        weather_service._breaker.update(state="closed", failures=0, opened_at=None, last_error=None, short_circuited=0)
+
+
+def test_repeated_coordinates_hit_cache():
+    first = weather_service.get_current_weather(17.385, 78.486)
+    # Same ~1 km grid cell
+    second = weather_service.get_current_weather(17.3851, 78.4862)
+    assert first["temperature"] == 25.5 and first["location"] == "Stubville"
+    assert second == first
+    assert len(StubHandler.calls) == 1
+    assert weather_service.cache_stats()["hits"] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(weather_service.time, "monotonic", lambda: now[0])
+    weather_service.get_current_weather(10, 10)
+    now[0] += weather_service.WEATHER_CACHE_TTL - 1
+    weather_service.get_current_weather(10, 10)
+    assert len(StubHandler.calls) == 1
+    now[0] += 2
+    weather_service.get_current_weather(10, 10)
+    assert len(StubHandler.calls) == 2
+
+
+def test_concurrent_misses_share_one_call():
+    StubHandler.release = threading.Event()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(weather_service.get_current_weather(20, 20)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    while not StubHandler.calls:
+        threading.Event().wait(0.01)
+    StubHandler.release.set()
+    for t in threads:
+        t.join()
+    assert len(StubHandler.calls) == 1
+    assert len(results) == 8 and all(r["temperature"] == 25.5 for r in results)
+    assert weather_service.cache_stats()["shared"] == 7
+
+
+def test_least_recently_used_cell_is_evicted(monkeypatch):
+    monkeypatch.setattr(weather_service, "WEATHER_CACHE_SIZE", 2)
+    weather_service.get_current_weather(1, 1)
+    weather_service.get_current_weather(2, 2)
+    weather_service.get_current_weather(1, 1)        # (1, 1) is now the most recent
+    weather_service.get_current_weather(3, 3)        # evicts (2, 2)
+    assert len(StubHandler.calls) == 3
+    weather_service.get_current_weather(1, 1)
+    assert len(StubHandler.calls) == 3
+    weather_service.get_current_weather(2, 2)
+    assert len(StubHandler.calls) == 4
+
+
+def test_server_errors_are_retried_then_breaker_opens(monkeypatch):
+    monkeypatch.setattr(weather_service, "WEATHER_RETRIES", 2)
+    monkeypatch.setattr(weather_service, "WEATHER_BREAKER_THRESHOLD", 2)
+    monkeypatch.setattr(weather_service, "WEATHER_BREAKER_COOLDOWN", 60)
+    StubHandler.status = 503
+
+    fallback = weather_service._fallback_weather()
+    assert weather_service.get_current_weather(30, 30) == fallback
+    assert len(StubHandler.calls) == 3                      # first try + 2 retries
+    assert weather_service.get_current_weather(31, 31) == fallback
+    assert weather_service.breaker_status()["state"] == "open"
+
+    # Open breaker: fallback without calling upstream
+    calls = len(StubHandler.calls)
+    assert weather_service.get_current_weather(32, 32) == fallback
+    assert len(StubHandler.calls) == calls
+    assert weather_service.breaker_status()["short_circuited"] == 1
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    monkeypatch.setattr(weather_service, "WEATHER_RETRIES", 2)
+    StubHandler.status = 401
+    weather_service.get_current_weather(40, 40)
+    assert len(StubHandler.calls) == 1
+
+
+def test_half_open_probe_closes_breaker(monkeypatch):
+    monkeypatch.setattr(weather_service, "WEATHER_RETRIES", 0)
+    monkeypatch.setattr(weather_service, "WEATHER_BREAKER_THRESHOLD", 1)
+    monkeypatch.setattr(weather_service, "WEATHER_BREAKER_COOLDOWN", 0)
+    StubHandler.status = 500
+    weather_service.get_current_weather(50, 50)
+    assert weather_service.breaker_status()["state"] == "open"
+
+    StubHandler.status = 200
+    weather = weather_service.get_current_weather(51, 51)
+    assert weather["location"] == "Stubville"
+    assert weather_service.breaker_status()["state"] == "closed"
@@ -0,0 +1,193 @@
+"""
+tts_cache.py — Content-addressed cache of rendered speech
+Each (language, normalized text) pair is rendered once and kept as
+static/tts/<2 hex>/<sha256>.mp3, served by URL to every client that needs the
+same sentence (fallback messages, CROP_INFO advice, risk templates). A hit
+touches the file, so file mtimes give the least-recently-used order across
+workers and restarts; when the cache grows past TTS_CACHE_MAX_BYTES the least
+recently used files are deleted until it is back under 90% of the limit.
+
+Offline usage:
+    python tts_cache.py warm [--lang en,hi]   # pre-render CROP_INFO and RISK_TEMPLATES
+    python tts_cache.py report                # size and file count
+"""
+
+import os
+import sys
+import time
+import hashlib
+import threading
+import unicodedata
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(BASE_DIR, "static", "tts"))
+TTS_CACHE_URL = "/static/tts"
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Longer texts (free-form Gemini replies) rarely repeat and go to voice_store instead
+TTS_CACHE_MAX_CHARS = int(os.getenv("TTS_CACHE_MAX_CHARS", "600"))
+
+WARM_LANGUAGES = ("en", "hi", "te", "ta")
+LOW_WATERMARK = 0.9
+
+_lock = threading.Lock()
+_rendering = {}      # key -> [Lock, users], so concurrent misses for one text render it once
+_bytes = None        # approximate cache size, counted on first use
+_stats = {"hits": 0, "misses": 0, "renders": 0, "render_errors": 0, "evicted": 0, "evicted_bytes": 0}
+
+def normalize_text(text):
+    """Unicode NFC with runs of whitespace collapsed; case is kept (acronyms are read differently)."""
+    return " ".join(unicodedata.normalize("NFC", str(text)).split())
+
+def cache_key(language, text):
+    return hashlib.sha256(f"{language}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+def _location(key):
+    shard = key[:2]
+    return os.path.join(TTS_CACHE_DIR, shard, f"{key}.mp3"), f"{TTS_CACHE_URL}/{shard}/{key}.mp3"
+
+def cacheable(text):
+    return 0 < len(normalize_text(text)) <= TTS_CACHE_MAX_CHARS
+
+def _scan():
+    """-> [(mtime, size, path)] of cached files, least recently used first."""
+    files = []
+    try:
+        shards = [e.path for e in os.scandir(TTS_CACHE_DIR) if e.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return files
+    for shard in shards:
+        try:
+            for entry in os.scandir(shard):
+                if entry.name.endswith(".mp3"):
+                    st = entry.stat(follow_symlinks=False)
+                    files.append((st.st_mtime, st.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+    files.sort()
+    return files
+
+def _add_bytes(size):
+    global _bytes
+    with _lock:
+        if _bytes is None:
+            _bytes = sum(f[1] for f in _scan())
+        else:
+            _bytes += size
+        return _bytes
+
+def evict():
+    """Delete least recently used files until the cache is under 90% of TTS_CACHE_MAX_BYTES."""
+    global _bytes
+    files = _scan()
+    total = sum(f[1] for f in files)
+    evicted = evicted_bytes = 0
+    if total > TTS_CACHE_MAX_BYTES:
+        target = TTS_CACHE_MAX_BYTES * LOW_WATERMARK
+        for _, size, path in files:
+            if total <= target:
+                break
+            total -= size
+            try:
+                os.remove(path)
+                evicted += 1
+                evicted_bytes += size
+            except FileNotFoundError:
+                pass
+    with _lock:
+        _bytes = total
+        _stats["evicted"] += evicted
+        _stats["evicted_bytes"] += evicted_bytes
+    return evicted
+
+def get_or_render(text, language, render):
+    """
+    URL of the cached MP3 for `text`, rendering it with
+    render(text, language, output_path) on a miss. Returns None if rendering fails.
+    """
+    text = normalize_text(text)
+    key = cache_key(language, text)
+    path, url = _location(key)
+
+    with _lock:
+        entry = _rendering.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            try:
+                os.utime(path)   # mark as recently used
+                with _lock:
+                    _stats["hits"] += 1
+                return url
+            except FileNotFoundError:
+                pass
+
+            with _lock:
+                _stats["misses"] += 1
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                if not render(text, language, tmp_path) or not os.path.exists(tmp_path):
+                    raise RuntimeError("renderer produced no file")
+                os.replace(tmp_path, path)   # readers never see a partial file
+            except Exception as e:
+                print(f"TTS cache: render failed ({language}): {e}")
+                with _lock:
+                    _stats["render_errors"] += 1
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return None
+    finally:
+        with _lock:
+            entry[1] -= 1
+            if not entry[1]:   # drop the lock only once no thread holds or waits on it
+                del _rendering[key]
+
+    with _lock:
+        _stats["renders"] += 1
+    if _add_bytes(os.path.getsize(path)) > TTS_CACHE_MAX_BYTES:
+        evict()
+    return url
+
+def warm_texts(languages=WARM_LANGUAGES):
+    """(language, text) pairs worth pre-rendering: CROP_INFO advice and risk templates."""
+    from knowledge_base import CROP_INFO, RISK_TEMPLATES
+    pairs = []
+    for language in languages:
+        for crop_info in CROP_INFO.values():
+            pairs.extend((language, text) for text in crop_info.get(language, {}).values())
+        pairs.extend((language, text) for text in RISK_TEMPLATES.get(language, {}).values())
+    return list(dict.fromkeys(pairs))
+
+def warm(languages=WARM_LANGUAGES):
+    import voice_service
+    pairs = warm_texts(languages)
+    rendered = cached = failed = 0
+    started = time.perf_counter()
+    for language, text in pairs:
+        if os.path.exists(_location(cache_key(language, text))[0]):
+            cached += 1
+            continue
+        if get_or_render(text, language, voice_service.text_to_speech):
+            rendered += 1
+        else:
+            failed += 1
+    print(f"Warmed {len(pairs)} text(s) in {time.perf_counter() - started:.1f}s: "
+          f"{rendered} rendered, {cached} already cached, {failed} failed")
+    return {"rendered": rendered, "cached": cached, "failed": failed}
+
+def stats():
+    with _lock:
+        return {**_stats, "bytes": _bytes, "max_bytes": TTS_CACHE_MAX_BYTES}
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "warm":
+        args = sys.argv[2:]
+        languages = args[args.index("--lang") + 1].split(",") if "--lang" in args else WARM_LANGUAGES
+        warm(languages)
+    elif command == "report":
+        files = _scan()
+        print(f"{TTS_CACHE_DIR}: {len(files)} file(s), {sum(f[1] for f in files) / 1048576:.2f} MB "
+              f"(limit {TTS_CACHE_MAX_BYTES / 1048576:.0f} MB)")
+    else:
+        print(__doc__)
@@ -0,0 +1,201 @@
+"""
+voice_jobs.py — Voice chat pipeline and its background job mode
+run_pipeline() does one voice turn: decode -> STT -> LLM -> TTS. /api/voice_chat
+runs it inside the request; /api/voice_jobs queues it for a bounded pool of
+worker threads and returns a job id at once. Clients poll the job or follow
+it as Server-Sent Events; transcript and reply appear as soon as their stage
+finishes. Jobs live in the memory of the worker process that accepted them
+(deployments run one gunicorn worker) and are forgotten VOICE_JOB_TTL seconds
+after they finish.
+"""
+
+import os
+import time
+import uuid
+import queue
+import threading
+from collections import deque
+
+import chatbot_engine
+import voice_service
+import write_behind
+
+VOICE_JOB_WORKERS = int(os.getenv("VOICE_JOB_WORKERS", "2"))
+VOICE_JOB_QUEUE_SIZE = int(os.getenv("VOICE_JOB_QUEUE_SIZE", "32"))   # waiting jobs before 503
+VOICE_JOB_TTL = float(os.getenv("VOICE_JOB_TTL", "600"))              # seconds a finished job is kept
+
+STAGES = ("queue", "decode", "stt", "llm", "tts")
+LATENCY_WINDOW = 200   # recent samples per stage for the percentiles
+
+class VoiceInputError(ValueError):
+    """The recording could not be used (undecodable, or no speech recognized)."""
+
+def run_pipeline(audio, language, user_id=None, cultivation_context=None, timings=None, progress=None):
+    """
+    One voice turn. `timings` (dict) receives decode_ms, stt_ms, llm_ms, tts_ms;
+    `progress(stage, **fields)` is called as each stage starts and with its results.
+    -> {"user_text", "reply", "audio_url"}; raises VoiceInputError for unusable audio.
+    """
+    timings = {} if timings is None else timings
+    progress = progress or (lambda stage, **fields: None)
+
+    progress("decode")
+    t0 = time.perf_counter()
+    try:
+        pcm = voice_service.decode_audio(audio)
+    except Exception as e:
+        print(f"Voice decode error: {e}")
+        raise VoiceInputError("Could not read the audio file")
+    audio = None
+    t1 = time.perf_counter()
+    timings["decode_ms"] = (t1 - t0) * 1000
+
+    progress("stt")
+    user_text = voice_service.transcribe_pcm(pcm, language)
+    pcm = None  # the recording is not kept past transcription
+    t2 = time.perf_counter()
+    timings["stt_ms"] = (t2 - t1) * 1000
+    if not user_text:
+        raise VoiceInputError("Could not understand audio")
+
+    progress("llm", user_text=user_text)
+    reply_text = chatbot_engine.get_response(user_text, language, cultivation_context)
+    t3 = time.perf_counter()
+    timings["llm_ms"] = (t3 - t2) * 1000
+    if user_id:
+        write_behind.enqueue("Chats", [(user_id, user_text, False), (user_id, reply_text, True)])
+
+    progress("tts", reply=reply_text)
+    audio_url = voice_service.speak(reply_text, language)
+    timings["tts_ms"] = (time.perf_counter() - t3) * 1000
+    return {"user_text": user_text, "reply": reply_text, "audio_url": audio_url}
+
+# --- Job mode ---
+
+_queue = queue.Queue(maxsize=VOICE_JOB_QUEUE_SIZE)   # job ids
+_jobs = {}                                            # id -> job dict
+_changed = threading.Condition()                      # guards _jobs; notified on every job update
+_threads = []
+_threads_pid = None
+_start_lock = threading.Lock()
+_running = 0
+_latency = {stage: deque(maxlen=LATENCY_WINDOW) for stage in STAGES}
+_counts = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+def _ensure_started():
+    """Start the worker pool on first use (and again in a forked worker)."""
+    global _threads, _threads_pid
+    with _start_lock:
+        if _threads_pid == os.getpid() and all(t.is_alive() for t in _threads):
+            return
+        _threads = [t for t in _threads if _threads_pid == os.getpid() and t.is_alive()]
+        while len(_threads) < VOICE_JOB_WORKERS:
+            thread = threading.Thread(target=_work, name=f"voice-job-{len(_threads)}", daemon=True)
+            thread.start()
+            _threads.append(thread)
+        _threads_pid = os.getpid()
+
+def _prune(now):
+    for job_id in [j for j, job in _jobs.items() if job["finished_at"] and now - job["finished_at"] > VOICE_JOB_TTL]:
+        del _jobs[job_id]
+
+def submit(audio, language, user_id=None, cultivation_context=None):
+    """Queue a voice turn; returns the job id, or None if the queue is full."""
+    _ensure_started()
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    job = {
+        "job_id": job_id, "status": "queued", "stage": "queue", "created_at": now, "finished_at": None,
+        "user_text": None, "reply": None, "audio_url": None, "error": None, "timings": {},
+        "version": 0, "_input": (audio, language, user_id, cultivation_context),
+    }
+    with _changed:
+        _prune(now)
+        _jobs[job_id] = job
+    try:
+        _queue.put_nowait(job_id)
+    except queue.Full:
+        with _changed:
+            del _jobs[job_id]
+            _counts["rejected"] += 1
+        return None
+    with _changed:
+        _counts["submitted"] += 1
+    return job_id
+
+def _update(job, **fields):
+    with _changed:
+        job.update(fields)
+        job["version"] += 1
+        _changed.notify_all()
+
+def _work():
+    global _running
+    while True:
+        job_id = _queue.get()
+        with _changed:
+            job = _jobs.get(job_id)
+            if job is None:
+                continue
+            audio, language, user_id, cultivation_context = job.pop("_input")
+            _running += 1
+        timings = {"queue_ms": (time.time() - job["created_at"]) * 1000}
+        _update(job, status="running")
+
+        def progress(stage, **fields):
+            _update(job, stage=stage, timings=dict(timings), **fields)
+
+        try:
+            result = run_pipeline(audio, language, user_id, cultivation_context, timings, progress)
+            outcome = {"status": "done", **result}
+        except VoiceInputError as e:
+            outcome = {"status": "error", "error": str(e)}
+        except Exception as e:
+            print(f"Voice job {job_id} failed: {e}")
+            outcome = {"status": "error", "error": "Voice processing failed"}
+        finally:
+            audio = None
+            with _changed:
+                _running -= 1
+                _counts["completed" if outcome["status"] == "done" else "failed"] += 1
+                for key, value in timings.items():
+                    _latency[key[:-3]].append(value)
+        _update(job, stage=None, finished_at=time.time(), timings=timings, **outcome)
+
+def get(job_id):
+    """Public view of a job (None if unknown or expired)."""
+    with _changed:
+        job = _jobs.get(job_id)
+        return _public(job) if job else None
+
+def _public(job):
+    view = {k: v for k, v in job.items() if not k.startswith("_") and k != "finished_at"}
+    view["timings"] = {k: round(v, 1) for k, v in job["timings"].items()}
+    return view
+
+def wait(job_id, after_version, timeout):
+    """Block until the job changes past `after_version` (or timeout); returns get(job_id)."""
+    deadline = time.monotonic() + timeout
+    with _changed:
+        while True:
+            job = _jobs.get(job_id)
+            if job is None or job["version"] > after_version:
+                return _public(job) if job else None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return _public(job)
+            _changed.wait(remaining)
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def stats():
+    with _changed:
+        stages = {
+            stage: {"samples": len(samples), "p50_ms": round(_percentile(samples, 0.5), 1),
+                    "p95_ms": round(_percentile(samples, 0.95), 1), "max_ms": round(max(samples), 1)}
+            for stage, samples in _latency.items() if samples
+        }
+        return {**_counts, "queued": _queue.qsize(), "running": _running, "workers": VOICE_JOB_WORKERS,
+                "capacity": VOICE_JOB_QUEUE_SIZE, "jobs_kept": len(_jobs), "stages": stages}
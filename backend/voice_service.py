@@ -1,43 +1,82 @@
+import io
 import os
+import wave
+import tempfile
+import subprocess
 import speech_recognition as sr
 from gtts import gTTS
-from pydub import AudioSegment
 
-def transcribe_audio(audio_path, language='en'):
+import tts_cache
+import voice_store
+
+# In-memory pipeline: uploads are decoded straight to 16-bit mono PCM at the
+# rate the recognizer is fed, without writing WAV copies to disk.
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+STT_SAMPLE_RATE = int(os.getenv("STT_SAMPLE_RATE", "16000"))
+VOICE_MAX_UPLOAD_BYTES = int(os.getenv("VOICE_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+VOICE_DECODE_TIMEOUT = float(os.getenv("VOICE_DECODE_TIMEOUT", "20"))
+SAMPLE_WIDTH = 2  # bytes (s16le)
+
+LANG_MAP = {
+    'en': 'en-IN',
+    'hi': 'hi-IN',
+    'te': 'te-IN',
+    'ta': 'ta-IN',
+    'kn': 'kn-IN'
+}
+
+def _decode_wav(data):
+    """PCM frames of a 16-bit mono WAV at STT_SAMPLE_RATE, or None if it needs converting."""
+    try:
+        with wave.open(io.BytesIO(data)) as w:
+            if (w.getnchannels(), w.getsampwidth(), w.getframerate()) == (1, SAMPLE_WIDTH, STT_SAMPLE_RATE):
+                return w.readframes(w.getnframes())
+    except (wave.Error, EOFError):
+        pass
+    return None
+
+def _run_ffmpeg(source, pass_fds=()):
+    cmd = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-i", source,
+           "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(STT_SAMPLE_RATE), "pipe:1"]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          pass_fds=pass_fds, timeout=VOICE_DECODE_TIMEOUT, check=False)
+    if proc.returncode != 0 or not proc.stdout:
+        raise RuntimeError(f"ffmpeg decode failed: {proc.stderr.decode(errors='replace').strip()[-300:]}")
+    return proc.stdout
+
+def decode_audio(data):
     """
-    Reads an audio file, converts it to WAV (if needed), and uses Google Speech Recognition.
-    Maps language codes (en, hi, te, ta, kn) to SpeechRecognition codes (en-IN, hi-IN, te-IN, ta-IN, kn-IN).
+    Decode an uploaded recording (m4a, mp3, ogg, wav, ...) held in memory to
+    raw 16-bit mono PCM at STT_SAMPLE_RATE.
+    MP4/M4A recordings usually keep their index at the end of the file, so
+    ffmpeg needs a seekable input: the bytes go into an anonymous in-memory
+    file (memfd) where available, and through a temp file only elsewhere.
     """
-    lang_map = {
-        'en': 'en-IN',
-        'hi': 'hi-IN',
-        'te': 'te-IN',
-        'ta': 'ta-IN',
-        'kn': 'kn-IN'
-    }
-    sr_lang = lang_map.get(language, 'en-IN')
+    pcm = _decode_wav(data)
+    if pcm is not None:
+        return pcm
 
-    recognizer = sr.Recognizer()
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create("voice-upload")
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            return _run_ffmpeg(f"/dev/fd/{fd}", pass_fds=(fd,))
+        finally:
+            os.close(fd)
 
+    with tempfile.NamedTemporaryFile(suffix=".audio") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        return _run_ffmpeg(tmp.name)
+
+def transcribe_pcm(pcm, language='en'):
+    """Google Speech Recognition on decoded PCM (see decode_audio). Returns "" if nothing was understood."""
+    recognizer = sr.Recognizer()
     try:
-        # Convert non-wav to wav
-        if not audio_path.endswith('.wav'):
-            wav_path = audio_path + '.wav'
-            audio = AudioSegment.from_file(audio_path)
-            audio.export(wav_path, format="wav")
-            target_path = wav_path
-        else:
-            target_path = audio_path
-
-        with sr.AudioFile(target_path) as source:
-            audio_data = recognizer.record(source)
-            text = recognizer.recognize_google(audio_data, language=sr_lang)
-            
-        # Clean up temporary convert
-        if not audio_path.endswith('.wav') and os.path.exists(wav_path):
-            os.remove(wav_path)
-            
-        return text
+        audio_data = sr.AudioData(pcm, STT_SAMPLE_RATE, SAMPLE_WIDTH)
+        return recognizer.recognize_google(audio_data, language=LANG_MAP.get(language, 'en-IN'))
     except sr.UnknownValueError:
         return ""
     except Exception as e:
@@ -55,3 +94,17 @@ def text_to_speech(text, language='en', output_path='response.mp3'):
     except Exception as e:
         print(f"TTS Error: {e}")
         return None
+
+def speak(text, language='en'):
+    """
+    Render `text` and return the URL of the MP3 (None if TTS failed).
+    Short texts go through the content-addressed cache, so repeated replies
+    are rendered once; long one-off replies get their own file in voice_store.
+    """
+    if tts_cache.cacheable(text):
+        return tts_cache.get_or_render(text, language, text_to_speech)
+    output_path, url = voice_store.new_file(".mp3")
+    if not text_to_speech(text, language, output_path):
+        return None
+    voice_store.added(output_path)
+    return url
@@ -0,0 +1,174 @@
+"""
+voice_store.py — Lifecycle of the voice reply files under static/audio
+Each voice turn's MP3 is written to a shard directory picked from its id
+(static/audio/3f/3f9c...mp3, 256 shards) so no single directory grows large.
+Files live for VOICE_STORE_TTL seconds; a background sweeper deletes expired
+files and, when the store is above VOICE_STORE_MAX_BYTES, the oldest files
+until it is back under 90% of the limit. Files left in the flat layout by
+older versions (in_*.m4a, out_*.mp3, *.wav) are swept the same way.
+
+Offline usage:
+    python voice_store.py sweep    # evict now and print usage
+    python voice_store.py report   # usage only
+"""
+
+import os
+import sys
+import time
+import uuid
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VOICE_STORE_DIR = os.getenv("VOICE_STORE_DIR", os.path.join(BASE_DIR, "static", "audio"))
+VOICE_STORE_URL = "/static/audio"
+VOICE_STORE_TTL = float(os.getenv("VOICE_STORE_TTL", str(6 * 3600)))                      # seconds
+VOICE_STORE_MAX_BYTES = int(os.getenv("VOICE_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+VOICE_STORE_SWEEP_INTERVAL = float(os.getenv("VOICE_STORE_SWEEP_INTERVAL", "300"))         # seconds
+
+# A size-triggered sweep evicts down to this fraction of the limit
+LOW_WATERMARK = 0.9
+# Only voice artifacts are managed; anything else (e.g. .gitignore) is left alone
+VOICE_EXTENSIONS = (".mp3", ".wav", ".m4a", ".webm", ".ogg", ".aac", ".3gp", ".amr")
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_thread = None
+_thread_pid = None
+_usage = {"files": 0, "bytes": 0}   # as of the last sweep, plus files added since
+_stats = {"added": 0, "evicted_ttl": 0, "evicted_size": 0, "evicted_bytes": 0,
+          "sweeps": 0, "last_sweep_at": None, "last_sweep_ms": None, "errors": 0}
+
+def _count(**deltas):
+    with _lock:
+        for key, value in deltas.items():
+            _stats[key] += value
+
+def _ensure_started():
+    """Start the sweeper on first use (and again in a forked worker)."""
+    global _thread, _thread_pid
+    with _lock:
+        if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+            return
+        _thread = threading.Thread(target=_run, name="voice-store-sweeper", daemon=True)
+        _thread_pid = os.getpid()
+        _thread.start()
+
+def new_file(ext=".mp3"):
+    """
+    Reserve a path for a new artifact.
+    -> (path on disk, URL path the client fetches it from)
+    """
+    _ensure_started()
+    file_id = uuid.uuid4().hex
+    shard = file_id[:2]
+    os.makedirs(os.path.join(VOICE_STORE_DIR, shard), exist_ok=True)
+    name = f"{file_id}{ext}"
+    return os.path.join(VOICE_STORE_DIR, shard, name), f"{VOICE_STORE_URL}/{shard}/{name}"
+
+def added(path):
+    """Account for a file written to a path from new_file(); wakes the sweeper if over the limit."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    with _lock:
+        _usage["files"] += 1
+        _usage["bytes"] += size
+        _stats["added"] += 1
+        over = _usage["bytes"] > VOICE_STORE_MAX_BYTES
+    if over:
+        _wake.set()
+
+def _scan():
+    """-> [(mtime, size, path)] of every voice file in the store, shards and flat layout."""
+    files = []
+    dirs = [VOICE_STORE_DIR]
+    while dirs:
+        try:
+            entries = list(os.scandir(dirs.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.name.lower().endswith(VOICE_EXTENSIONS) and entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    files.append((st.st_mtime, st.st_size, entry.path))
+            except FileNotFoundError:
+                pass
+    return files
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        print(f"Voice store: could not evict {path}: {e}")
+        _count(errors=1)
+        return False
+
+def sweep(now=None):
+    """Evict expired files, then the oldest ones while over the size limit. Returns stats()."""
+    started = time.perf_counter()
+    now = time.time() if now is None else now
+    files = _scan()
+    expired = [f for f in files if now - f[0] > VOICE_STORE_TTL]
+    kept = sorted(f for f in files if now - f[0] <= VOICE_STORE_TTL)   # oldest first
+
+    evicted_ttl = evicted_size = evicted_bytes = 0
+    for _, size, path in expired:
+        if _remove(path):
+            evicted_ttl += 1
+            evicted_bytes += size
+
+    total = sum(size for _, size, _ in kept)
+    if total > VOICE_STORE_MAX_BYTES:
+        target = VOICE_STORE_MAX_BYTES * LOW_WATERMARK
+        while kept and total > target:
+            _, size, path = kept.pop(0)
+            total -= size
+            if _remove(path):
+                evicted_size += 1
+                evicted_bytes += size
+
+    with _lock:
+        _usage["files"], _usage["bytes"] = len(kept), total
+        _stats["evicted_ttl"] += evicted_ttl
+        _stats["evicted_size"] += evicted_size
+        _stats["evicted_bytes"] += evicted_bytes
+        _stats["sweeps"] += 1
+        _stats["last_sweep_at"] = round(now)
+        _stats["last_sweep_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return stats()
+
+def _run():
+    while True:
+        try:
+            sweep()
+        except Exception as e:
+            print(f"Voice store sweep failed: {e}")
+            _count(errors=1)
+        _wake.wait(VOICE_STORE_SWEEP_INTERVAL)
+        _wake.clear()
+
+def stats():
+    with _lock:
+        return {**_stats, **_usage, "max_bytes": VOICE_STORE_MAX_BYTES, "ttl": VOICE_STORE_TTL}
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command in ("sweep", "report"):
+        result = sweep() if command == "sweep" else None
+        files = _scan()
+        print(f"{VOICE_STORE_DIR}: {len(files)} file(s), {sum(f[1] for f in files) / 1048576:.2f} MB "
+              f"(limit {VOICE_STORE_MAX_BYTES / 1048576:.0f} MB, TTL {VOICE_STORE_TTL / 3600:g} h)")
+        if result:
+            print(f"Evicted {result['evicted_ttl']} expired and {result['evicted_size']} over-limit file(s), "
+                  f"{result['evicted_bytes'] / 1048576:.2f} MB")
+    else:
+        print(__doc__)
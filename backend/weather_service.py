@@ -1,30 +1,187 @@
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 
 from dotenv import load_dotenv
 load_dotenv()
 
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+# Overridable so tests can point the client at a local stub server
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5/weather")
+
+# --- Geo-bucketed cache ---
+# Nearby coordinates share one grid cell: lat/lon rounded to
+# WEATHER_CACHE_PRECISION decimals (2 ~ 1.1 km, 1 ~ 11 km).
+WEATHER_CACHE_PRECISION = int(os.getenv("WEATHER_CACHE_PRECISION", "2"))
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "2048"))
+
+_cache = OrderedDict()   # cell -> (expires_at, weather), least recently used first
+_inflight = {}           # cell -> Future shared by concurrent misses
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "shared": 0}
+
+# --- HTTP client ---
+# One keep-alive session for all upstream calls. A slow upstream is cut off
+# by the connect/read timeouts instead of pinning a gunicorn thread.
+WEATHER_CONNECT_TIMEOUT = float(os.getenv("WEATHER_CONNECT_TIMEOUT", "2"))
+WEATHER_READ_TIMEOUT = float(os.getenv("WEATHER_READ_TIMEOUT", "4"))
+WEATHER_RETRIES = int(os.getenv("WEATHER_RETRIES", "2"))
+WEATHER_RETRY_BACKOFF = float(os.getenv("WEATHER_RETRY_BACKOFF", "0.2"))
+
+# --- Circuit breaker ---
+# After WEATHER_BREAKER_THRESHOLD consecutive failed fetches the breaker opens
+# and the regional-average fallback is served without calling upstream. Once
+# WEATHER_BREAKER_COOLDOWN seconds pass, a single probe request is let through.
+WEATHER_BREAKER_THRESHOLD = int(os.getenv("WEATHER_BREAKER_THRESHOLD", "5"))
+WEATHER_BREAKER_COOLDOWN = float(os.getenv("WEATHER_BREAKER_COOLDOWN", "30"))
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+_breaker_lock = threading.Lock()
+_breaker = {
+    "state": "closed",         # closed | open | half_open
+    "failures": 0,             # consecutive failed fetches
+    "opened_at": None,         # monotonic time the breaker last opened
+    "last_error": None,
+    "short_circuited": 0,      # requests answered by the fallback while open
+}
+
+def _breaker_allows():
+    """True if an upstream call may be made now (closed, or this caller is the probe)."""
+    with _breaker_lock:
+        if _breaker["state"] == "closed":
+            return True
+        if _breaker["state"] == "open" and time.monotonic() - _breaker["opened_at"] >= WEATHER_BREAKER_COOLDOWN:
+            _breaker["state"] = "half_open"
+            return True
+        _breaker["short_circuited"] += 1
+        return False
+
+def _breaker_record(success, error=None):
+    with _breaker_lock:
+        if success:
+            if _breaker["state"] != "closed":
+                print("Weather breaker closed: upstream recovered")
+            _breaker.update(state="closed", failures=0, opened_at=None)
+            return
+        _breaker["failures"] += 1
+        _breaker["last_error"] = error
+        if _breaker["state"] == "half_open" or _breaker["failures"] >= WEATHER_BREAKER_THRESHOLD:
+            if _breaker["state"] != "open":
+                print(f"Weather breaker opened after {_breaker['failures']} failures: {error}")
+            _breaker.update(state="open", opened_at=time.monotonic())
+
+def breaker_status():
+    with _breaker_lock:
+        status = {k: v for k, v in _breaker.items() if k != "opened_at"}
+        if _breaker["state"] == "open":
+            status["retry_in_seconds"] = round(max(0.0, WEATHER_BREAKER_COOLDOWN - (time.monotonic() - _breaker["opened_at"])), 1)
+        return status
+
+def _fallback_weather():
+    # Fallback to regional averages
+    return {"temperature": 30.0, "humidity": 70.0, "rainfall": 150.0}
+
+def _fetch_weather(lat, lon):
+    """
+    Upstream call with bounded, jittered retries behind the circuit breaker.
+    Returns None when OpenWeatherMap can't be used.
+    """
+    if not _breaker_allows():
+        return None
+
+    params = {"lat": lat, "lon": lon, "appid": OPENWEATHER_API_KEY, "units": "metric"}
+    error = None
+    for attempt in range(WEATHER_RETRIES + 1):
+        if attempt:
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, WEATHER_RETRY_BACKOFF * (2 ** (attempt - 1))))
+        try:
+            response = _session.get(OPENWEATHER_URL, params=params,
+                                    timeout=(WEATHER_CONNECT_TIMEOUT, WEATHER_READ_TIMEOUT))
+            if response.status_code == 200:
+                data = response.json()
+                _breaker_record(True)
+                return {
+                    "temperature": data['main']['temp'],
+                    "humidity": data['main']['humidity'],
+                    "rainfall": 200.0, # Placeholder
+                    "location": data.get("name", "Unknown Location")
+                }
+            error = f"HTTP {response.status_code}"
+            # Client errors (bad key, bad coords) won't improve on retry
+            if response.status_code < 500 and response.status_code != 429:
+                break
+        except Exception as e:
+            error = str(e)
+
+    print(f"Weather API Error: {error}")
+    _breaker_record(False, error)
+    return None
 
 def get_current_weather(lat, lon):
     """
     Fetches real-time weather from OpenWeatherMap.
     Returns: {'temperature': 25, 'humidity': 60, 'rainfall': 100} (rainfall estimated)
+    Results are cached per grid cell; concurrent misses for a cell share one call.
     """
     try:
-        url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
-        response = requests.get(url)
-        data = response.json()
-        
-        if response.status_code == 200:
-            return {
-                "temperature": data['main']['temp'],
-                "humidity": data['main']['humidity'],
-                "rainfall": 200.0, # Placeholder
-                "location": data.get("name", "Unknown Location")
-            }
-    except Exception as e:
-        print(f"Weather API Error: {e}")
-    
-    # Fallback to regional averages
-    return {"temperature": 30.0, "humidity": 70.0, "rainfall": 150.0}
+        cell = (round(float(lat), WEATHER_CACHE_PRECISION), round(float(lon), WEATHER_CACHE_PRECISION))
+    except (TypeError, ValueError):
+        print(f"Weather API Error: invalid coordinates {lat}, {lon}")
+        return _fallback_weather()
+
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(cell)
+        if entry and entry[0] > now:
+            _cache.move_to_end(cell)
+            _stats["hits"] += 1
+            return dict(entry[1])
+
+        future = _inflight.get(cell)
+        leader = future is None
+        if leader:
+            future = _inflight[cell] = Future()
+            _stats["misses"] += 1
+        else:
+            _stats["shared"] += 1
+
+    if not leader:
+        weather = future.result()
+        return dict(weather) if weather else _fallback_weather()
+
+    weather = None
+    try:
+        weather = _fetch_weather(*cell)
+        if weather:
+            with _cache_lock:
+                _cache[cell] = (time.monotonic() + WEATHER_CACHE_TTL, weather)
+                _cache.move_to_end(cell)
+                while len(_cache) > WEATHER_CACHE_SIZE:
+                    _cache.popitem(last=False)
+    finally:
+        with _cache_lock:
+            _inflight.pop(cell, None)
+        future.set_result(weather)
+
+    return dict(weather) if weather else _fallback_weather()
+
+def cache_stats():
+    with _cache_lock:
+        return {**_stats, "entries": len(_cache), "precision": WEATHER_CACHE_PRECISION, "ttl": WEATHER_CACHE_TTL}
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        for key in _stats:
+            _stats[key] = 0
@@ -0,0 +1,217 @@
+"""
+write_behind.py — Buffered inserts for the Chats / Recommendations audit log
+Request handlers enqueue rows and respond immediately; a background flusher
+writes them in multi-row INSERTs, one transaction per batch. The queue is
+bounded: when it is full, enqueue() blocks briefly (backpressure) and then
+drops the rows, counting them as lost. drain() flushes what is left on
+shutdown (gunicorn worker_exit hook and atexit).
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import db
+
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "5000"))              # queued items
+WRITE_BATCH_ROWS = int(os.getenv("WRITE_BATCH_ROWS", "200"))               # flush when this many rows wait...
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "0.5"))     # ...or the oldest waited this long (s)
+WRITE_ENQUEUE_TIMEOUT = float(os.getenv("WRITE_ENQUEUE_TIMEOUT", "0.25"))  # backpressure wait before dropping
+WRITE_RETRIES = int(os.getenv("WRITE_RETRIES", "3"))
+WRITE_DRAIN_TIMEOUT = float(os.getenv("WRITE_DRAIN_TIMEOUT", "10"))
+
+# Tables that may be written behind, with their insert columns
+TABLES = {
+    "Chats": ("user_id", "message", "is_bot"),
+    "Recommendations": ("user_id", "latitude", "longitude", "soil_type",
+                        "weather_json", "recommended_crops", "details", "full_response"),
+    "ExplanationTexts": ("hash", "text"),
+}
+# Appended to the INSERT for tables whose rows may already exist
+ON_CONFLICT = {
+    "ExplanationTexts": "ON CONFLICT (hash) DO NOTHING",
+}
+
+_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)   # items: (table, [row, ...])
+_thread = None
+_thread_pid = None
+_start_lock = threading.Lock()
+_stop = threading.Event()
+_stats_lock = threading.Lock()
+_stats = {"enqueued": 0, "written": 0, "lost": 0, "batches": 0, "failed_flushes": 0, "backpressure_waits": 0,
+          "last_error": None, "last_error_at": None}
+
+def _count(**deltas):
+    with _stats_lock:
+        for key, value in deltas.items():
+            _stats[key] += value
+
+def _ensure_started():
+    """Start the flusher on first use (and again in a forked worker)."""
+    global _thread, _thread_pid
+    if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+        return
+    with _start_lock:
+        if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+            return
+        _stop.clear()
+        _thread = threading.Thread(target=_run, name="write-behind", daemon=True)
+        _thread_pid = os.getpid()
+        _thread.start()
+
+def enqueue(table, rows):
+    """
+    Queue rows (tuples in TABLES[table] column order) for insertion.
+    Rows of one call are written together and in order.
+    Returns False if the queue stayed full and the rows were dropped.
+    """
+    if table not in TABLES:
+        raise ValueError(f"{table} is not a write-behind table")
+    rows = [tuple(r) for r in rows]
+    if not rows:
+        return True
+    _ensure_started()
+    item = (table, rows)
+    try:
+        _queue.put_nowait(item)
+    except queue.Full:
+        _count(backpressure_waits=1)
+        try:
+            _queue.put(item, timeout=WRITE_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            _count(lost=len(rows))
+            print(f"Write-behind queue full: dropped {len(rows)} {table} row(s)")
+            return False
+    _count(enqueued=len(rows))
+    return True
+
+def _insert(cur, items):
+    by_table = {}
+    for table, rows in items:
+        by_table.setdefault(table, []).extend(rows)
+    for table, rows in by_table.items():
+        execute_values(
+            cur, f"INSERT INTO {table} ({', '.join(TABLES[table])}) VALUES %s {ON_CONFLICT.get(table, '')}",
+            rows, page_size=len(rows)
+        )
+
+def _write(items):
+    """Write one batch; returns the number of rows that could not be stored."""
+    total = sum(len(rows) for _, rows in items)
+    for attempt in range(WRITE_RETRIES):
+        if attempt:
+            time.sleep(min(2.0, 0.2 * (2 ** attempt)))
+        try:
+            with db.connection() as conn:
+                if conn is None:
+                    raise psycopg2.OperationalError("database unavailable")
+                cur = conn.cursor()
+                try:
+                    _insert(cur, items)
+                    conn.commit()
+                    return 0
+                except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                    # One bad row (e.g. a deleted user) must not sink the whole batch
+                    conn.rollback()
+                    _count_error(e)
+                    return _write_one_by_one(conn, cur, items)
+                finally:
+                    cur.close()
+        except Exception as e:
+            _count_error(e)
+    print(f"Write-behind flush failed after {WRITE_RETRIES} attempts: {_stats['last_error']}")
+    return total
+
+def _write_one_by_one(conn, cur, items):
+    lost = 0
+    for item in items:
+        try:
+            _insert(cur, [item])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            _count_error(e)
+            lost += len(item[1])
+    return lost
+
+def _count_error(e):
+    with _stats_lock:
+        _stats["last_error"] = str(e).strip()
+        _stats["last_error_at"] = round(time.time())
+
+def _flush(items):
+    total = sum(len(rows) for _, rows in items)
+    lost = _write(items)
+    _count(written=total - lost, lost=lost, batches=1, failed_flushes=1 if lost else 0)
+    if lost:
+        tables = sorted({table for table, _ in items})
+        print(f"ALERT: write-behind lost {lost} of {total} row(s) for {', '.join(tables)}: {_stats['last_error']}")
+    for _ in items:
+        _queue.task_done()
+
+def _run():
+    while not _stop.is_set():
+        try:
+            first = _queue.get(timeout=WRITE_FLUSH_INTERVAL)
+        except queue.Empty:
+            continue
+        items, rows = [first], len(first[1])
+        deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+        while rows < WRITE_BATCH_ROWS and not _stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            items.append(item)
+            rows += len(item[1])
+        _flush(items)
+
+def drain(timeout=None):
+    """
+    Stop the flusher and write everything still queued.
+    Rows that cannot be written within `timeout` seconds are counted as lost.
+    """
+    global _thread
+    timeout = WRITE_DRAIN_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    _stop.set()
+    thread = _thread
+    if thread is not None and _thread_pid == os.getpid() and thread.is_alive():
+        thread.join(max(0.0, deadline - time.monotonic()))
+    _thread = None
+
+    while True:
+        items, rows = [], 0
+        while rows < WRITE_BATCH_ROWS:
+            try:
+                item = _queue.get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            rows += len(item[1])
+        if not items:
+            break
+        if time.monotonic() >= deadline:
+            _count(lost=rows)
+            for _ in items:
+                _queue.task_done()
+            continue
+        _flush(items)
+
+    lost = stats()["lost"]
+    if lost:
+        print(f"Write-behind drained; {lost} row(s) lost since start")
+
+atexit.register(drain)
+
+def stats():
+    with _stats_lock:
+        return {**_stats, "queued": _queue.qsize(), "capacity": WRITE_QUEUE_SIZE}
@@ -0,0 +1,155 @@
+"""
+xai_cache.py — Two-tier cache for Gemini crop explanations
+Tier 1 is an in-process LRU; tier 2 is the ExplanationCache table in
+PostgreSQL, shared by every worker. Keys use the crop, soil type, language
+and coarse weather buckets, since the advice only changes between buckets.
+"""
+
+import os
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import db
+
+XAI_CACHE_TTL = float(os.getenv("XAI_CACHE_TTL", str(7 * 24 * 3600)))
+XAI_CACHE_SIZE = int(os.getenv("XAI_CACHE_SIZE", "2048"))          # in-process entries
+XAI_CACHE_DB_ROWS = int(os.getenv("XAI_CACHE_DB_ROWS", "50000"))    # persistent rows
+# Bucket widths for the weather part of the key
+XAI_TEMP_BUCKET = float(os.getenv("XAI_TEMP_BUCKET", "2"))          # °C
+XAI_RAIN_BUCKET = float(os.getenv("XAI_RAIN_BUCKET", "25"))         # mm
+XAI_HUMIDITY_BUCKET = float(os.getenv("XAI_HUMIDITY_BUCKET", "10")) # %
+
+# Expired / surplus DB rows are pruned once every this many stores
+PRUNE_EVERY = 200
+
+_memory = OrderedDict()   # key -> (expires_at, text), least recently used first
+_lock = threading.Lock()
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+_stores_since_prune = 0
+
+def _bucket(value, width):
+    try:
+        return int(math.floor(float(value) / width))
+    except (TypeError, ValueError):
+        return "na"
+
+def make_key(crop, soil_type, weather_data, language):
+    return "|".join(str(part) for part in (
+        str(crop).strip().lower(),
+        str(soil_type).strip().lower(),
+        f"t{_bucket(weather_data.get('temperature'), XAI_TEMP_BUCKET)}",
+        f"r{_bucket(weather_data.get('rainfall'), XAI_RAIN_BUCKET)}",
+        f"h{_bucket(weather_data.get('humidity'), XAI_HUMIDITY_BUCKET)}",
+        language,
+    ))
+
+def _remember(key, text, expires_at):
+    with _lock:
+        _memory[key] = (expires_at, text)
+        _memory.move_to_end(key)
+        while len(_memory) > XAI_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+def get_memory(key):
+    """In-process lookup only (no I/O)."""
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _memory[key]
+            return None
+        _memory.move_to_end(key)
+        _stats["memory_hits"] += 1
+        return entry[1]
+
+def get(key):
+    """Cached explanation text for `key`, or None. Promotes DB hits into memory."""
+    text = get_memory(key)
+    if text is not None:
+        return text
+
+    try:
+        with db.connection() as conn:
+            if conn:
+                cur = conn.cursor()
+                # The row's age is computed by the server: created_at has no
+                # time zone, so comparing its epoch with time.time() would be
+                # off by the server's UTC offset
+                cur.execute(
+                    "SELECT text, EXTRACT(EPOCH FROM CURRENT_TIMESTAMP::timestamp - created_at) FROM ExplanationCache "
+                    "WHERE cache_key = %s AND created_at > NOW() - make_interval(secs => %s)",
+                    (key, XAI_CACHE_TTL)
+                )
+                row = cur.fetchone()
+                cur.close()
+                if row:
+                    _remember(key, row[0], time.time() + XAI_CACHE_TTL - float(row[1]))
+                    with _lock:
+                        _stats["db_hits"] += 1
+                    return row[0]
+    except Exception as e:
+        print(f"XAI Cache Read Error: {e}")
+
+    with _lock:
+        _stats["misses"] += 1
+    return None
+
+def put(key, text):
+    global _stores_since_prune
+    _remember(key, text, time.time() + XAI_CACHE_TTL)
+    with _lock:
+        _stats["stores"] += 1
+        _stores_since_prune += 1
+        prune = _stores_since_prune >= PRUNE_EVERY
+        if prune:
+            _stores_since_prune = 0
+
+    try:
+        with db.connection() as conn:
+            if conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    INSERT INTO ExplanationCache (cache_key, text) VALUES (%s, %s)
+                    ON CONFLICT (cache_key) DO UPDATE SET text = EXCLUDED.text, created_at = CURRENT_TIMESTAMP
+                """, (key, text))
+                if prune:
+                    _prune(cur)
+                conn.commit()
+                cur.close()
+    except Exception as e:
+        print(f"XAI Cache Write Error: {e}")
+
+def _prune(cur):
+    cur.execute("DELETE FROM ExplanationCache WHERE created_at <= NOW() - make_interval(secs => %s)", (XAI_CACHE_TTL,))
+    cur.execute("""
+        DELETE FROM ExplanationCache WHERE cache_key IN (
+            SELECT cache_key FROM ExplanationCache ORDER BY created_at DESC OFFSET %s
+        )
+    """, (XAI_CACHE_DB_ROWS,))
+
+def invalidate(key=None):
+    """Drop one key, or everything when key is None, from both tiers."""
+    with _lock:
+        if key is None:
+            _memory.clear()
+        else:
+            _memory.pop(key, None)
+    try:
+        with db.connection() as conn:
+            if conn:
+                cur = conn.cursor()
+                if key is None:
+                    cur.execute("DELETE FROM ExplanationCache")
+                else:
+                    cur.execute("DELETE FROM ExplanationCache WHERE cache_key = %s", (key,))
+                conn.commit()
+                cur.close()
+    except Exception as e:
+        print(f"XAI Cache Invalidate Error: {e}")
+
+def stats():
+    with _lock:
+        return {**_stats, "memory_entries": len(_memory), "ttl": XAI_CACHE_TTL}
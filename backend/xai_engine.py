@@ -1,8 +1,11 @@
 
 import os
+from concurrent.futures import ThreadPoolExecutor, wait
 from google import genai
+from google.genai import types
 from dotenv import load_dotenv
 from knowledge_base import CROP_INFO
+import xai_cache
 
 import sys
 
@@ -10,9 +13,19 @@ import sys
 load_dotenv()
 API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Explanations for one recommendation are generated concurrently on a shared,
+# bounded pool. Anything not back within XAI_DEADLINE_SECONDS gets the template.
+XAI_MAX_WORKERS = int(os.getenv("XAI_MAX_WORKERS", "6"))
+XAI_DEADLINE_SECONDS = float(os.getenv("XAI_DEADLINE_SECONDS", "8"))
+# Client-side limit on each Gemini call, so a hung call frees its pool worker.
+# A little above the deadline: a late answer is still cached for next time.
+XAI_REQUEST_TIMEOUT = float(os.getenv("XAI_REQUEST_TIMEOUT", str(XAI_DEADLINE_SECONDS + 4)))
+_executor = ThreadPoolExecutor(max_workers=XAI_MAX_WORKERS, thread_name_prefix="xai")
+
 if API_KEY:
     try:
-        client = genai.Client(api_key=API_KEY)
+        client = genai.Client(api_key=API_KEY,
+                              http_options=types.HttpOptions(timeout=int(XAI_REQUEST_TIMEOUT * 1000)))
         print("DEBUG: XAI Engine loaded gemini-2.5-flash via google.genai")
         sys.stdout.flush()
     except Exception as e:
@@ -49,6 +62,12 @@ def generate_explanation(crop, soil_type, weather_data, confidence, language="en
     if not client:
         return generate_fallback(crop, soil_type, weather_data, language)
 
+    # Same crop/soil/language in the same weather buckets -> reuse the answer
+    cache_key = xai_cache.make_key(crop, soil_type, weather_data, language)
+    cached = xai_cache.get(cache_key)
+    if cached is not None:
+        return {"text": cached, "bullet_points": []}
+
     try:
         # 2. Construct Prompt for Gemini
         prompt = f"""
@@ -80,6 +99,8 @@ def generate_explanation(crop, soil_type, weather_data, confidence, language="en
             contents=prompt
         )
         text_response = response.text.strip()
+        if text_response:
+            xai_cache.put(cache_key, text_response)
         
         return {
             "text": text_response,
@@ -90,6 +111,42 @@ def generate_explanation(crop, soil_type, weather_data, confidence, language="en
         print(f"Gemini XAI Error: {e}")
         return generate_fallback(crop, soil_type, weather_data, language)
 
+def generate_explanations(crops, soil_type, weather_data, language="en", deadline=None):
+    """
+    Explanations for several crops at once, in the same order as `crops`
+    (a list of {"crop", "confidence"}). Gemini calls run in parallel; any that
+    miss the deadline fall back to generate_fallback, so this returns within
+    roughly `deadline` seconds (XAI_DEADLINE_SECONDS by default).
+    """
+    if not client:
+        return [generate_fallback(c['crop'], soil_type, weather_data, language) for c in crops]
+
+    if deadline is None:
+        deadline = XAI_DEADLINE_SECONDS
+
+    # In-process cache hits are answered inline; the rest go to the pool
+    futures = []
+    for c in crops:
+        cached = xai_cache.get_memory(xai_cache.make_key(c['crop'], soil_type, weather_data, language))
+        if cached is not None:
+            futures.append({"text": cached, "bullet_points": []})
+        else:
+            futures.append(_executor.submit(generate_explanation, c['crop'], soil_type, weather_data, c['confidence'], language))
+    pending = [f for f in futures if not isinstance(f, dict)]
+    done, _ = wait(pending, timeout=deadline) if pending else (set(), set())
+
+    explanations = []
+    for item, future in zip(crops, futures):
+        if isinstance(future, dict):
+            explanations.append(future)
+        elif future in done:
+            explanations.append(future.result())
+        else:
+            future.cancel()
+            print(f"Gemini XAI Timeout: {item['crop']} exceeded {deadline}s, using template")
+            explanations.append(generate_fallback(item['crop'], soil_type, weather_data, language))
+    return explanations
+
 def generate_fallback(crop, soil_type, weather_data, language):
     if language not in TEMPLATES: language = "en"
     t = TEMPLATES[language]
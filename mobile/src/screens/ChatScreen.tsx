@@ -17,31 +17,57 @@ export default function ChatScreen({ language = 'en', user }: any) {
     // History Modal
     const [showHistoryModal, setShowHistoryModal] = useState(false);
     const [chatHistoryData, setChatHistoryData] = useState<any[]>([]);
+    const [historyCursor, setHistoryCursor] = useState<string | null>(null);
+    const [loadingOlder, setLoadingOlder] = useState(false);
 
     // Audio states
     const [recording, setRecording] = useState<Audio.Recording | null>(null);
     const [isRecording, setIsRecording] = useState(false);
 
+    // One page of history, newest page first; `before` is the cursor from the previous page
+    const fetchHistoryPage = async (before: string | null) => {
+        const token = await AsyncStorage.getItem('authToken');
+        if (!token) return null;
+        // No cache-buster: the server answers an unchanged page with 304 via ETag
+        const query = before ? `limit=50&before_id=${before}` : 'limit=50';
+        const res = await fetch(`${API_URL}/chat_history?${query}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`,
+                'Cache-Control': 'no-cache'
+            }
+        });
+        const data = await res.json();
+        return { data, cursor: res.headers.get('X-Next-Before-Id') };
+    };
+
     const fetchHistory = async () => {
         try {
-            const token = await AsyncStorage.getItem('authToken');
-            if (token) {
-                const res = await fetch(`${API_URL}/chat_history?t=${new Date().getTime()}`, {
-                    headers: {
-                        'Authorization': `Bearer ${token}`,
-                        'Cache-Control': 'no-cache'
-                    }
-                });
-                const data = await res.json();
-                if (data && data.length > 0) {
-                    setChatHistoryData(data);
-                }
+            const page = await fetchHistoryPage(null);
+            if (page && page.data && page.data.length > 0) {
+                setChatHistoryData(page.data);
+                setHistoryCursor(page.cursor);
             }
         } catch (e) {
             console.log("Failed to load chat history", e);
         }
     };
 
+    const loadOlderHistory = async () => {
+        if (!historyCursor || loadingOlder) return;
+        setLoadingOlder(true);
+        try {
+            const page = await fetchHistoryPage(historyCursor);
+            if (page && page.data) {
+                setChatHistoryData(prev => [...page.data, ...prev]);
+                setHistoryCursor(page.cursor);
+            }
+        } catch (e) {
+            console.log("Failed to load older chats", e);
+        } finally {
+            setLoadingOlder(false);
+        }
+    };
+
     useEffect(() => {
         return () => {
             if (recording) {
@@ -261,6 +287,13 @@ export default function ChatScreen({ language = 'en', user }: any) {
                     data={chatHistoryData}
                     keyExtractor={(_, i) => i.toString()}
                     contentContainerStyle={{ padding: 15 }}
+                    ListHeaderComponent={historyCursor ? (
+                        <TouchableOpacity onPress={loadOlderHistory} style={styles.loadOlderBtn} disabled={loadingOlder}>
+                            <Text style={styles.loadOlderText}>
+                                {loadingOlder ? "Loading..." : (language === 'hi' ? "पुराने संदेश देखें" : (language === 'te' ? "పాత సందేశాలు చూడండి" : "Load older messages"))}
+                            </Text>
+                        </TouchableOpacity>
+                    ) : null}
                     renderItem={({ item }) => (
                         <View style={[styles.msgContainer, item.isBot ? styles.msgLeft : styles.msgRight]}>
                             {item.isBot && <Image source={{ uri: 'https://cdn-icons-png.flaticon.com/512/4205/4205906.png' }} style={styles.msgAvatar} />}
@@ -295,5 +328,7 @@ const styles = StyleSheet.create({
     chatInputBox: { flexDirection: 'row', padding: 10, paddingHorizontal: 15, backgroundColor: 'white', alignItems: 'center', borderTopWidth: 1, borderTopColor: '#eee', marginBottom: 70 },
     micBtn: { backgroundColor: '#FF9800', width: 45, height: 45, borderRadius: 23, justifyContent: 'center', alignItems: 'center', marginRight: 10, elevation: 5 },
     chatInput: { flex: 1, backgroundColor: '#f8f9fa', borderRadius: 25, paddingHorizontal: 20, paddingVertical: 12, marginRight: 10, fontSize: 16, color: '#333' },
+    loadOlderBtn: { alignSelf: 'center', paddingVertical: 8, paddingHorizontal: 16, marginBottom: 15, borderRadius: 20, backgroundColor: '#f1f8e9' },
+    loadOlderText: { color: COLORS.headerGreen, fontWeight: 'bold' },
     sendBtn: { backgroundColor: COLORS.headerGreen, width: 45, height: 45, borderRadius: 23, justifyContent: 'center', alignItems: 'center', shadowColor: COLORS.headerGreen, shadowOpacity: 0.3, shadowRadius: 5, elevation: 5 },
 });
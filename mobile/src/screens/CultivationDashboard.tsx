@@ -13,6 +13,8 @@ export default function CultivationDashboard({ language = 'en' }: any) {
     const [activeTab, setActiveTab] = useState('SCHEDULE'); // SCHEDULE or LEDGER
 
     const [historyData, setHistoryData] = useState<any[]>([]);
+    const [historyCursor, setHistoryCursor] = useState<string | null>(null);
+    const [loadingMoreHistory, setLoadingMoreHistory] = useState(false);
     const [showHistoryModal, setShowHistoryModal] = useState(false);
 
     // Detailed History State
@@ -60,10 +62,12 @@ export default function CultivationDashboard({ language = 'en' }: any) {
         }
     };
 
-    const fetchHistory = async () => {
+    // Pages of 50, newest first; the server returns the next page's cursor in X-Next-Before
+    const fetchHistory = async (before: string | null = null) => {
         try {
             const token = await AsyncStorage.getItem('authToken');
-            const res = await fetch(`${API_URL}/api/cultivation/history?t=${new Date().getTime()}`, {
+            const cursor = before ? `&before=${encodeURIComponent(before)}` : '';
+            const res = await fetch(`${API_URL}/api/cultivation/history?t=${new Date().getTime()}${cursor}`, {
                 headers: {
                     'Authorization': `Bearer ${token}`,
                     'Cache-Control': 'no-cache'
@@ -71,13 +75,21 @@ export default function CultivationDashboard({ language = 'en' }: any) {
             });
             if (res.ok) {
                 const data = await res.json();
-                setHistoryData(data);
+                setHistoryData(prev => before ? [...prev, ...data] : data);
+                setHistoryCursor(res.headers.get('X-Next-Before'));
             }
         } catch (e) {
             console.log(e);
         }
     };
 
+    const loadMoreHistory = async () => {
+        if (!historyCursor || loadingMoreHistory) return;
+        setLoadingMoreHistory(true);
+        await fetchHistory(historyCursor);
+        setLoadingMoreHistory(false);
+    };
+
     const fetchHistoryDetails = async (id: number) => {
         setHistoryLoading(true);
         try {
@@ -249,6 +261,13 @@ export default function CultivationDashboard({ language = 'en' }: any) {
                             keyExtractor={(item) => item.id.toString()}
                             contentContainerStyle={{ padding: 20 }}
                             ListEmptyComponent={<Text style={{ textAlign: 'center', marginTop: 50, color: '#888' }}>No past cultivations found.</Text>}
+                            onEndReached={loadMoreHistory}
+                            onEndReachedThreshold={0.5}
+                            ListFooterComponent={historyCursor ? (
+                                <TouchableOpacity onPress={loadMoreHistory} disabled={loadingMoreHistory} style={{ alignItems: 'center', padding: 10 }}>
+                                    <Text style={{ color: COLORS.headerGreen, fontWeight: 'bold' }}>{loadingMoreHistory ? "Loading..." : "Load more"}</Text>
+                                </TouchableOpacity>
+                            ) : null}
                             renderItem={({ item }) => (
                                 <TouchableOpacity style={styles.historyCard} onPress={() => fetchHistoryDetails(item.id)}>
                                     <View style={{ flexDirection: 'row', justifyContent: 'space-between' }}>